@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# Timed benchmarks of the hot paths over a synthetic corpus, compared against a stored baseline
+# Run from the repo folder, with either python2 or python3; the benchmarks whose modules
+# do not import under the running python are skipped
+# Timings only compare on the same machine and python, so no baseline is committed: write one first
+# from the commit to compare against, and then pass it as --baseline, e.g.,
+# $ python benchmarks/run_benchmarks.py --preset swbd --output benchmarks/baseline.json
+# $ python benchmarks/run_benchmarks.py --preset swbd --output bench.json --baseline benchmarks/baseline.json
+# 10/18/2026
+
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import traceback
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scratch import scratch_dir
+from benchmarks.synth_corpus import make_corpus, PRESETS
+
+
+##
+# the benchmarks, each being (name, python major versions, setup func)
+# a setup func takes the corpus file and a scratch folder, does the untimed preparation,
+# and returns (run, items): run is the timed callable, and items is the number of sentences it processes
+BENCHMARKS = []
+
+def benchmark(name, versions=(2, 3)):
+    def register(func):
+        BENCHMARKS.append((name, versions, func))
+        return func
+    return register
+
+
+@benchmark('read_csv_chunks')
+def bench_read_csv_chunks(corpus, tmp):
+    from corpus_db import read_csv_chunks
+    n = [0]
+    def run():
+        n[0] = 0
+        for chunk in read_csv_chunks(corpus, ['convId', 'turnId', 'globalId', 'rawWord'],
+                types={'convId': int, 'turnId': int, 'globalId': int}):
+            n[0] += len(chunk['rawWord'])
+    run()
+    return run, n[0]
+
+@benchmark('readtext_2list')
+def bench_readtext_2list(corpus, tmp):
+    from comp_info_cont import readtext_2list
+    data = readtext_2list(corpus)
+    return (lambda: readtext_2list(corpus)), sum(len(v) for v in data.values())
+
+@benchmark('load_textdb')
+def bench_load_textdb(corpus, tmp):
+    from corpus_db import load_textdb
+    return (lambda: load_textdb(corpus)), len(load_textdb(corpus))
+
+@benchmark('batch_entropy')
+def bench_batch_entropy(corpus, tmp):
+    from comp_info_cont import readtext_2list, batch_entropy
+    from ngram_lm import train_lm
+    data = readtext_2list(corpus)
+    sentences = [text for cid in sorted(data) for _, text in data[cid]]
+    lm = train_lm(sentences, order=3)
+    return (lambda: batch_entropy(lm, sentences)), len(sentences)
+
+# the per-sentence path, timed over the first 1000 sentences only
+@benchmark('sentence_entropy')
+def bench_sentence_entropy(corpus, tmp):
+    from comp_info_cont import readtext_2list, sentence_entropy
+    from ngram_lm import train_lm
+    data = readtext_2list(corpus)
+    sentences = [text for cid in sorted(data) for _, text in data[cid]]
+    lm = train_lm(sentences, order=3)
+    sentences = sentences[:1000]
+    return (lambda: [sentence_entropy(lm, text) for text in sentences]), len(sentences)
+
+@benchmark('crossvalidate_fold')
+def bench_crossvalidate_fold(corpus, tmp):
+    from comp_info_cont import make_folds, crossvalidate_fold
+    from corpus_db import load_textdb
+    db = load_textdb(corpus)
+    random.seed(2017)
+    foldIds = make_folds(sorted(set(db.convId.tolist())))
+    return (lambda: crossvalidate_fold(db, foldIds, 0)), len(db)
+
+@benchmark('unigram_freq')
+def bench_unigram_freq(corpus, tmp):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'experiments'))
+    from information_content import unigram_freq
+    from corpus_db import read_csv_columns
+    n = len(read_csv_columns(corpus, ['rawWord'])['rawWord'])
+    return (lambda: unigram_freq(corpus, os.path.join(tmp, 'unigram_freq.csv'))), n
+
+@benchmark('make_topic_ids', versions=(3,))
+def bench_make_topic_ids(corpus, tmp):
+    from topic_segment import make_topic_ids
+    from corpus_db import read_csv_columns
+    import numpy as np
+    cids = read_csv_columns(corpus, ['convId'], types={'convId': int})['convId']
+    nrows = np.bincount(cids)[np.unique(cids)]
+    # a boundary after every 10th sentence, as the bound_ind returned by conduct_segment
+    bounds = [list(range(10, n, 10)) + [n] for n in nrows.tolist()]
+    return (lambda: [make_topic_ids(b) for b in bounds]), int(nrows.sum())
+
+@benchmark('pseudo_seg_fixedlen', versions=(3,))
+def bench_pseudo_seg_fixedlen(corpus, tmp):
+    from topic_segment import pseudo_seg_fixedlen
+    from corpus_db import read_csv_columns
+    n = len(read_csv_columns(corpus, ['rawWord'])['rawWord'])
+    return (lambda: pseudo_seg_fixedlen(corpus, os.path.join(tmp, 'pseudo_fixed.csv'))), n
+
+@benchmark('pseudo_seg_randlen', versions=(3,))
+def bench_pseudo_seg_randlen(corpus, tmp):
+    from topic_segment import pseudo_seg_randlen
+    from corpus_db import read_csv_columns
+    n = len(read_csv_columns(corpus, ['rawWord'])['rawWord'])
+    return (lambda: pseudo_seg_randlen(corpus, os.path.join(tmp, 'pseudo_rand.csv'), 5, 15, seed=2017)), n
+
+
+##
+# the progress printed by the benchmarked functions is not part of the report
+@contextmanager
+def quiet():
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as FNULL:
+        sys.stdout = FNULL
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+##
+# run the benchmarks whose names match, each timed as the best of repeats
+# a benchmark that raises is reported as failed, and the others still run
+def run_benchmarks(corpus, tmp, names=None, repeats=3):
+    """
+    return: (results, skipped, failed), dicts keyed by benchmark name
+    """
+    results, skipped, failed = {}, {}, {}
+    for name, versions, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        if sys.version_info[0] not in versions:
+            skipped[name] = 'python%s only' % '/'.join(str(v) for v in versions)
+            continue
+        try:
+            with quiet():
+                run, items = setup(corpus, tmp)
+        except ImportError as e:
+            skipped[name] = str(e)
+            continue
+        except Exception as e:
+            failed[name] = '%s: %s' % (type(e).__name__, e)
+            traceback.print_exc()
+            continue
+        times = []
+        try:
+            for _ in range(repeats):
+                with quiet():
+                    start = time.time()
+                    run()
+                    times.append(time.time() - start)
+        except Exception as e:
+            failed[name] = '%s: %s' % (type(e).__name__, e)
+            traceback.print_exc()
+            continue
+        seconds = min(times)
+        results[name] = {'seconds': seconds, 'items': items, 'items_per_sec': items / seconds if seconds > 0 else None}
+        print('%-20s %8.3fs %10d sents %12.0f sents/s' % (name, seconds, items, results[name]['items_per_sec'] or 0))
+    for name in sorted(skipped):
+        print('%-20s skipped: %s' % (name, skipped[name]))
+    for name in sorted(failed):
+        print('%-20s FAILED: %s' % (name, failed[name]))
+    return results, skipped, failed
+
+
+##
+# compare results with a baseline report
+def compare(results, baseline, tolerance=0.2):
+    """
+    tolerance: the fraction by which a benchmark may be slower than its baseline
+    return: a list of (name, seconds, baseline seconds) that regressed
+    """
+    regressed = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        seconds, base = results[name]['seconds'], baseline[name]['seconds']
+        status = 'REGRESSED' if seconds > base * (1 + tolerance) else 'ok'
+        print('%-20s %8.3fs vs %8.3fs baseline (%+.0f%%) %s' % (name, seconds, base, (seconds / base - 1) * 100, status))
+        if status != 'ok':
+            regressed.append((name, seconds, base))
+    return regressed
+
+
+##
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time the hot paths over a synthetic corpus')
+    parser.add_argument('--preset', default='swbd', choices=sorted(PRESETS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='the names of the benchmarks to run')
+    parser.add_argument('--output', help='the JSON file that results are written to')
+    parser.add_argument('--baseline', help='a JSON file written by --output, to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with scratch_dir('bench') as tmp:
+        # models are trained afresh, rather than read from or written to the LM cache
+        os.environ['LM_CACHE_DIR'] = os.path.join(tmp, 'lm_cache')
+        os.environ['LM_CACHE_MAX_MB'] = '0'
+        corpus = os.path.join(tmp, 'corpus.csv')
+        start = time.time()
+        sent_n = make_corpus(corpus, args.preset, args.seed)
+        print('%s corpus of %s sentences made in %.1fs' % (args.preset, sent_n, time.time() - start))
+        results, skipped, failed = run_benchmarks(corpus, tmp, args.only, args.repeats)
+
+    report = {'preset': args.preset, 'seed': args.seed, 'sentences': sent_n,
+        'python': platform.python_version(), 'machine': platform.node(),
+        'results': results, 'skipped': skipped, 'failed': failed}
+    if args.output:
+        with open(args.output, 'w') as fw:
+            json.dump(report, fw, indent=2, sort_keys=True)
+    if args.baseline:
+        if not os.path.isfile(args.baseline):
+            print('no baseline at %s, write one first with --output' % args.baseline)
+            sys.exit(2)
+        with open(args.baseline, 'r') as fr:
+            baseline = json.load(fr)
+        if (baseline['machine'], baseline['python']) != (report['machine'], report['python']):
+            print('baseline was run with python %s on %s' % (baseline['python'], baseline['machine']))
+        if (baseline['preset'], baseline['seed']) != (args.preset, args.seed):
+            print('baseline was run on preset %s, seed %s' % (baseline['preset'], baseline['seed']))
+            sys.exit(2)
+        if compare(results, baseline['results'], args.tolerance):
+            sys.exit(1)
+    if failed:
+        sys.exit(1)
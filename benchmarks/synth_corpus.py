@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# Generate seeded synthetic dialogue corpora shaped like the text dbs,
+# i.e., the columns convId,turnId,speaker,globalId,rawWord of SWBD_text_db.csv
+# 10/18/2026
+
+from __future__ import print_function, division
+
+import sys
+import csv
+import numpy as np
+
+
+# corpus shapes: the number of conversations, their mean length in sentences, and the vocab size
+PRESETS = {
+    'swbd': {'conv_n': 1100, 'mean_sents': 90, 'vocab_size': 20000, 'mean_words': 8},
+    'bnc': {'conv_n': 1400, 'mean_sents': 70, 'vocab_size': 40000, 'mean_words': 7},
+    'small': {'conv_n': 60, 'mean_sents': 40, 'vocab_size': 2000, 'mean_words': 7},
+}
+
+
+##
+# write a synthetic corpus to outputfile
+def make_corpus(outputfile, preset='swbd', seed=0, zipf_s=1.1):
+    """
+    preset: a key of PRESETS
+    zipf_s: the exponent of the Zipfian word distribution
+    return: the number of sentences written
+    """
+    conf = PRESETS[preset]
+    rng = np.random.RandomState(seed)
+    # word ranks drawn from a Zipfian distribution over the vocab
+    ranks = np.arange(1, conf['vocab_size'] + 1)
+    word_p = ranks ** -zipf_s
+    word_p /= word_p.sum()
+    words = np.array(['w%s' % i for i in range(conf['vocab_size'])])
+
+    # conversation lengths, and the sentence lengths of the whole corpus
+    conv_lens = np.maximum(rng.poisson(conf['mean_sents'], conf['conv_n']), 10)
+    sent_n = int(conv_lens.sum())
+    sent_lens = np.maximum(rng.geometric(1.0 / conf['mean_words'], sent_n), 1)
+    tokens = words[rng.choice(len(words), int(sent_lens.sum()), p=word_p)]
+    offsets = np.r_[0, np.cumsum(sent_lens)]
+    # speaker turns of one to three sentences
+    turn_lens = rng.randint(1, 4, sent_n)
+
+    with open(outputfile, 'w') as fw:
+        csvwriter = csv.writer(fw, delimiter=',')
+        csvwriter.writerow(['convId', 'turnId', 'speaker', 'globalId', 'rawWord'])
+        k = 0
+        for cid, conv_len in enumerate(conv_lens):
+            turn_id, left = 0, 0
+            for gid in range(1, conv_len + 1):
+                if left == 0:
+                    turn_id += 1
+                    left = turn_lens[k]
+                left -= 1
+                speaker = 'A' if turn_id % 2 == 1 else 'B'
+                csvwriter.writerow([cid + 1, turn_id, speaker, gid, ' '.join(tokens[offsets[k]:offsets[k+1]])])
+                k += 1
+    return sent_n
+
+
+##
+# main, e.g.,
+# $ python benchmarks/synth_corpus.py data/synth_swbd.csv swbd 0
+if __name__ == '__main__':
+    outputfile = sys.argv[1]
+    preset = sys.argv[2] if len(sys.argv) > 2 else 'swbd'
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    print('%s sentences written to %s' % (make_corpus(outputfile, preset, seed), outputfile))
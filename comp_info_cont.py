@@ -7,55 +7,64 @@
 from __future__ import print_function
 
 import sys
-import subprocess
 import csv
 import math
-import os
+import numpy as np
 
 from random import shuffle
+from multiprocessing import Pool
 from nltk.util import ngrams
 from srilm import *
+from ngram_lm import NgramLM, UnigramTable, LengthMeans, load_model, score_sentences, score_tokens, entropy_from_scores
+from ngram_lm import count_ngrams, merge_counts, subtract_counts
+from lm_cache import default_cache, lm_key
+from run_stats import default_stats
+from corpus_db import is_textdb, load_textdb, read_csv_chunks, read_csv_columns, rows_by_conv
+from job_queue import JobStore, run_units
+from score_cover import COVER_COLUMNS, text_hash, file_digest, cover_path, read_cover, atomic_write
+from token_store import write_chunk, write_index
 
 
 # the function that reads text into a dict object
 # key is convId, and value is a list
-def readtext_2list(datafile, cid_col=0, gid_col=3, text_col=4):
+def readtext_2list(datafile, cid_col='convId', gid_col='globalId', text_col='rawWord'):
     """
+    datafile: a text db csv, or one compiled by corpus_db.compile_textdb
     return: dict(convId -> [(globalId, sentence_text)])
     """
     data = {}
-    with open(datafile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[cid_col]), int(items[gid_col]), items[text_col]
-            if cid in data:
-                if text != '':
-                    data[cid].append((gid, text))
-            else:
-                if text != '':
-                    data[cid] = [(gid, text)]
+    if is_textdb(datafile):
+        db = load_textdb(datafile)
+        for i in np.nonzero(db.word_num() > 0)[0]:
+            cid, gid = int(db.convId[i]), int(db.globalId[i])
+            data.setdefault(cid, []).append((gid, db.text(i)))
+        return data
+    for chunk in read_csv_chunks(datafile, [cid_col, gid_col, text_col], types={cid_col: int, gid_col: int}):
+        for cid, gid, text in zip(chunk[cid_col].tolist(), chunk[gid_col].tolist(), chunk[text_col]):
+            if text != '':
+                data.setdefault(cid, []).append((gid, text))
     return data
 
 # reads text into a dict
 # key is convId, and value is a dict
 # the number of sentences per convId is limited by sent_n
-def readtext_2dict(datafile, cid_col=0, gid_col=3, text_col=4, sent_n=100):
+def readtext_2dict(datafile, cid_col='convId', gid_col='globalId', text_col='rawWord', sent_n=100):
     """
+    datafile: a text db csv, or one compiled by corpus_db.compile_textdb
     sent_n: the maximum number of sentences read from per convId
     return: dict(convId -> {globalId -> sentence_text})
     """
     data = {}
-    with open(datafile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[cid_col]), int(items[gid_col]), items[text_col]
+    if is_textdb(datafile):
+        db = load_textdb(datafile)
+        for i in np.nonzero(db.globalId <= sent_n)[0]:
+            cid, gid = int(db.convId[i]), int(db.globalId[i])
+            data.setdefault(cid, {})[gid] = db.text(i)
+        return data
+    for chunk in read_csv_chunks(datafile, [cid_col, gid_col, text_col], types={cid_col: int, gid_col: int}):
+        for cid, gid, text in zip(chunk[cid_col].tolist(), chunk[gid_col].tolist(), chunk[text_col]):
             if gid <= sent_n:
-                if cid in data:
-                    data[cid][gid] = text
-                else:
-                    data[cid] = {gid : text}
+                data.setdefault(cid, {})[gid] = text
     return data
 
 
@@ -83,277 +92,544 @@ def get_sents_fromdict(data, conv_ids, gid):
             sents.append(data[cid][gid])
     return sents
 
-# compute sentence entropy
+# compute sentence entropy with n-grams up to order
 # adding <s> to the left, and </s> to the right
-def sentence_entropy(lm, text):
+def sentence_entropy(lm, text, order=3):
+    if isinstance(lm, NgramLM):
+        return batch_entropy(lm, [text], order)[0]
     words = text.split()
-    trigrams = list(ngrams(words, 3, pad_left=True, left_pad_symbol='<s>', pad_right=True, right_pad_symbol='</s>'))
-    trigrams = trigrams[1:-1]
-    probs = [-getTrigramProb(lm, ' '.join(gram)) for gram in trigrams]
+    grams = list(ngrams(words, order, pad_left=True, left_pad_symbol='<s>', pad_right=True, right_pad_symbol='</s>'))
+    # from the second word up to the first </s>
+    grams = grams[1:len(words)+1]
+    probs = [-getNgramProb(lm, ' '.join(gram), order) for gram in grams]
     ent = float(sum(probs)) / len(probs)
     return ent
 
+# compute the entropy of a batch of sentences in one pass
+# the same values as calling sentence_entropy on each of them
+def batch_entropy(lm, sentences, order=None):
+    logprobs, offsets = score_sentences(lm, sentences, order)
+    return entropy_from_scores(logprobs, offsets).tolist()
+
+# batch_entropy within a timed stage, keeping the per-token scores if they are to be written
+def score_entropy(lm, sentences, timer, order=None, with_tokens=False):
+    """
+    timer: the run_stats stage that counts the sentences and tokens scored
+    return: (ents, scores); scores are the (ids, logprobs, orders, offsets) of ngram_lm.score_tokens
+        if with_tokens, else None
+    """
+    if with_tokens:
+        scores = score_tokens(lm, sentences, order)
+        logprobs, offsets = scores[1], scores[3]
+    else:
+        scores = None
+        logprobs, offsets = score_sentences(lm, sentences, order)
+    timer.count_scores(logprobs, offsets)
+    return entropy_from_scores(logprobs, offsets).tolist(), scores
+
 
 ##
-# Compute the information content of sentence using cross-validation
-def crossvalidate(inputfile, outputfile):
-    # read data
-    alldata = readtext_2list(inputfile)
+# the length-normalized entropy, ent_norm = ent / the mean ent of the sentences with the same wordNum,
+# written as two more columns of the entropy outputs, instead of in a separate step by norm_information.R
+NORM_COLUMNS = ['wordNum', 'ent_norm']
+
+# the word counts of the rows of a text db, looked up by convId and globalId
+def row_word_nums(db, cids, gids):
+    K = int(db.globalId.max()) + 1
+    keys = db.convId.astype(np.int64) * K + db.globalId
+    order = np.argsort(keys, kind='mergesort')
+    pos = order[np.searchsorted(keys[order], np.asarray(cids, dtype=np.int64) * K + np.asarray(gids, dtype=np.int64))]
+    return db.word_num()[pos]
+
+# add the wordNum and ent_norm columns to result rows (convId, globalId, ent) held in memory
+def add_ent_norm(results, lengths):
+    ents = [row[2] for row in results]
+    means = LengthMeans()
+    means.add(ents, lengths)
+    return [tuple(row) + (n, e) for row, n, e in zip(results, np.asarray(lengths).tolist(), means.normalize(ents, lengths).tolist())]
+
+# add the ent_norm column to an entropy output file, in a streaming pass over it, so that memory use is bounded
+def write_ent_norm(outputfile, means=None, word_nums=None, chunksize=100000):
+    """
+    means: the LengthMeans of the entropies in outputfile, if they were summed up while scoring;
+        otherwise they are summed up in a first pass over outputfile
+    word_nums: a function (convIds, globalIds) -> word counts, for an outputfile without the wordNum column
+    """
+    columns = ['convId', 'globalId', 'ent'] + ([] if word_nums else ['wordNum'])
+    def chunks():
+        for chunk in read_csv_chunks(outputfile, columns, chunksize=chunksize,
+                types={'convId': int, 'globalId': int, 'ent': float, 'wordNum': int}):
+            if word_nums:
+                chunk['wordNum'] = word_nums(chunk['convId'], chunk['globalId'])
+            yield chunk
+    if means is None:
+        means = LengthMeans()
+        for chunk in chunks():
+            means.add(chunk['ent'], chunk['wordNum'])
+    with atomic_write(outputfile) as fw:
+        csvwriter = csv.writer(fw, delimiter=',')
+        csvwriter.writerow(['convId', 'globalId', 'ent'] + NORM_COLUMNS)
+        for chunk in chunks():
+            csvwriter.writerows(zip(chunk['convId'].tolist(), chunk['globalId'].tolist(), chunk['ent'].tolist(),
+                chunk['wordNum'].tolist(), means.normalize(chunk['ent'], chunk['wordNum']).tolist()))
 
-    # prepare folds
-    convIds = alldata.keys()
+
+##
+# split convIds into foldN random folds
+def make_folds(convIds, foldN=10):
+    """
+    return: dict(fold index -> list of convIds)
+    """
+    convIds = list(convIds)
     shuffle(convIds)
-    foldN = 10
-    foldLen = len(convIds) / foldN
+    foldLen = len(convIds) // foldN
     foldIds = {}
     for i in range(0, foldN):
         if i < foldN-1:
             foldIds[i] = convIds[i*foldLen : (i+1)*foldLen]
         else:
             foldIds[i] = convIds[i*foldLen:]
+    return foldIds
 
-    # conduct cross-validation
-    results = []
-    for i in range(0, foldN):
-        traintext = []
-        for j in range(0, i) + range(i+1, foldN):
-            traintext += get_sents_fromlist(alldata, foldIds[j])
-        # write traintext to file
-        trainfile = 'data/lm/train.txt'
-        with open(trainfile, 'w') as fw:
-            for row in traintext:
-                fw.write(row + '\n')
-        # train the lm
-        lmfile = 'data/lm/train.lm'
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed for fold %s' % i)
-        print('training done for fold %s' % i)
-        # compute entropy
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        for cid in foldIds[i]:
-            for row in alldata[cid]:
-                gid, text = row[0], row[1]
-                ent = sentence_entropy(lm, text)
-                results.append((cid, gid, ent))
-        print('computing done for fold %s' % i)
 
-    # write results to file
-    with open(outputfile, 'w') as fw:
-        csvwriter = csv.writer(fw, delimiter=',')
-        csvwriter.writerow(['convId', 'globalId', 'ent'])
-        for row in results:
-            csvwriter.writerow(row)
+##
+# train on all folds but fold i and compute the entropy of the sentences in fold i
+def crossvalidate_fold(db, foldIds, i, order=3, tokens=None):
+    """
+    order: the n-gram order of the LM
+    tokens: the folder that the per-token scores of the fold are written to, as chunk fold<i>
+    return: a list of (convId, globalId, ent), ordered as foldIds[i]
+    """
+    stats = default_stats()
+    rows = np.nonzero(db.word_num() > 0)[0]
+    # train the lm on the other folds
+    train_rows = rows[~np.isin(db.convId[rows], foldIds[i])]
+    ids, offsets = db.select(train_rows)
+    with stats.stage('train', sentences=len(train_rows), tokens=len(ids)):
+        lm = default_cache().train_lm_ids(db.vocab, ids, offsets, order=order)
+    print('training done for fold %s' % i)
+    # compute entropy
+    test_rows = rows_by_conv(db, rows, foldIds[i])
+    with stats.stage('score') as timer:
+        ents, scores = score_entropy(lm, db.select(test_rows), timer, with_tokens=tokens is not None)
+    if tokens is not None:
+        with stats.stage('write', sentences=len(test_rows)):
+            write_chunk(tokens, 'fold%s' % i, db.convId[test_rows], db.globalId[test_rows], *scores)
+    results = []
+    for r, ent in zip(test_rows, ents):
+        results.append((int(db.convId[r]), int(db.globalId[r]), ent))
+    print('computing done for fold %s' % i)
+    return results
+
+# each worker process loads the text db once, and memory-maps it if it is compiled
+_worker_dbs = {}
+def _crossvalidate_fold_worker(args):
+    inputfile, foldIds, i, order, tokens = args
+    if inputfile not in _worker_dbs:
+        _worker_dbs[inputfile] = load_textdb(inputfile)
+    cache = default_cache()
+    hits, misses = cache.hits, cache.misses
+    results = crossvalidate_fold(_worker_dbs[inputfile], foldIds, i, order, tokens)
+    return results, cache.hits - hits, cache.misses - misses, default_stats().take()
 
 
 ##
 # Compute the information content of sentence using cross-validation
-# LMs are trained per sentence position, i.e., 100 models trained for the first 100 sentences respectively
-def crossvalidate_samepos(inputfile, outputfile, sent_n=100):
+def crossvalidate(inputfile, outputfile, workers=1, order=3, tokens=None, norm=False):
+    """
+    inputfile: a text db csv, or one compiled by corpus_db.compile_textdb
+    workers: the number of processes that run folds in parallel
+    order: the n-gram order of the LMs
+    tokens: a folder that the per-token scores are also written to, see token_store
+    norm: also write the NORM_COLUMNS
+    """
     # read data
-    alldata = readtext_2dict(inputfile, sent_n=sent_n)
+    stats = default_stats()
+    with stats.stage('read') as timer:
+        db = load_textdb(inputfile)
+        timer.count(len(db), int(db.offsets[-1]))
+    rows = np.nonzero(db.word_num() > 0)[0]
 
     # prepare folds
-    convIds = alldata.keys()
-    shuffle(convIds)
-    foldN = 10
-    foldLen = len(convIds) / foldN
-    foldIds = {}
-    for i in range(0, foldN):
-        if i < foldN-1:
-            foldIds[i] = convIds[i*foldLen : (i+1)*foldLen]
-        else:
-            foldIds[i] = convIds[i*foldLen:]
-
-    # estimate information content using cross-validation
+    foldIds = make_folds(np.unique(db.convId[rows]).tolist())
+    foldN = len(foldIds)
+
+    # conduct cross-validation, merging the folds in order
+    if workers > 1:
+        pool = Pool(processes=min(workers, foldN))
+        try:
+            worker_results = pool.map(_crossvalidate_fold_worker, [(inputfile, foldIds, i, order, tokens) for i in range(0, foldN)])
+        finally:
+            pool.close()
+            pool.join()
+        fold_results = [r[0] for r in worker_results]
+        default_cache().hits += sum(r[1] for r in worker_results)
+        default_cache().misses += sum(r[2] for r in worker_results)
+        for r in worker_results:
+            stats.merge(r[3])
+    else:
+        fold_results = [crossvalidate_fold(db, foldIds, i, order, tokens) for i in range(0, foldN)]
     results = []
-    for i in range(0, foldN):
-        # for each sentence position
-        for j in range(1, sent_n+1):
-            # collect all sentences at position j in other convIds than foldIds[i]
-            traintext = []
-            for k in range(0, i) + range(i+1, foldN):
-                text = get_sents_fromdict(alldata, foldIds[k], j)
-                traintext += text
-            # write traintext to file
-            trainfile = 'data/lm/train.txt'
-            with open(trainfile, 'w') as fw:
-                for text in traintext:
-                    fw.write(text + '\n')
-            # train the LM
-            lmfile = 'data/lm/train.lm'
-            srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-            train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-            FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-            return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-            if return_code != 0:
-                raise Exception('trainning failed for fold %s at sentence position %s' % (i, j))
-            # compute sentence entropy
-            lm = initLM(3)
-            readLM(lm, lmfile)
-            for cid in foldIds[i]:
-                if j in alldata[cid]:
-                    gid = j
-                    text = alldata[cid][j]
-                    ent = sentence_entropy(lm, text)
-                    results.append((cid, j, ent))
-            # print process within a fold
-            sys.stdout.write('\rfold %s, %s/%s sentences done' % (i, j, sent_n))
-            sys.stdout.flush()
-        # print when a fold is done
-        print('\nDone for fold %s' % i)
+    for rows in fold_results:
+        results += rows
+    if norm:
+        results = add_ent_norm(results, row_word_nums(db, [r[0] for r in results], [r[1] for r in results]))
 
-    # write results to outputfile
-    with open(outputfile, 'w') as fw:
+    # write results to file
+    with stats.stage('write', sentences=len(results)), open(outputfile, 'w') as fw:
         csvwriter = csv.writer(fw, delimiter=',')
-        csvwriter.writerow(['convId', 'globalId', 'ent'])
+        csvwriter.writerow(['convId', 'globalId', 'ent'] + (NORM_COLUMNS if norm else []))
         for row in results:
             csvwriter.writerow(row)
+    if tokens is not None:
+        write_index(tokens, ['fold%s' % i for i in range(0, foldN)], db.vocab)
+
+
+##
+# the text db, rows and folds of a crossvalidate_samepos job, loaded once per process
+# the folds are kept in the job store, so that all the workers and reruns of the job share them
+_samepos_jobs = {}
+def samepos_job(inputfile, sent_n, store, order=3, tokens=None):
+    """
+    store: job_queue.JobStore
+    return: (db, rows, foldIds, fold_of_row)
+    """
+    key = (inputfile, sent_n, store.store_dir, order, tokens)
+    if key not in _samepos_jobs:
+        params = store.init('job', lambda: {'inputfile': inputfile, 'sent_n': sent_n, 'order': order, 'tokens': tokens})
+        if params != {'inputfile': inputfile, 'sent_n': sent_n, 'order': order, 'tokens': tokens}:
+            raise Exception('job store %s was made for %s' % (store.store_dir, params))
+        # read data
+        with default_stats().stage('read') as timer:
+            db = load_textdb(inputfile)
+            timer.count(len(db), int(db.offsets[-1]))
+        rows = np.nonzero(db.globalId <= sent_n)[0]
+        # prepare folds
+        folds = store.init('folds', lambda: [f for _, f in sorted(make_folds(np.unique(db.convId[rows]).tolist()).items())])
+        foldIds = dict(enumerate(folds))
+        fold_of_row = np.zeros(len(rows), dtype=np.int64)
+        for i in range(0, len(foldIds)):
+            fold_of_row[np.isin(db.convId[rows], foldIds[i])] = i
+        _samepos_jobs[key] = (db, rows, foldIds, fold_of_row)
+    return _samepos_jobs[key]
+
+# the name of work unit (i, j), i.e., fold i and sentence position j, and the reverse
+def unit_name(i, j):
+    return 'fold%s_pos%s' % (i, j)
+
+def unit_index(unit):
+    fold, pos = unit.split('_')
+    return int(fold[4:]), int(pos[3:])
+
+##
+# the work unit (i, j) of crossvalidate_samepos: train the LM on the sentences at position j
+# in all folds but fold i, and compute the entropy of the sentences at position j in fold i
+_samepos_counts = {}
+def samepos_unit(job, unit, share_counts=True, order=3, tokens=None):
+    """
+    tokens: the folder that the per-token scores of the unit are written to, as a chunk named after it
+    return: a list of (convId, globalId, ent), ordered as foldIds[i]
+    """
+    db, rows, foldIds, fold_of_row = job
+    i, j = unit_index(unit)
+    stats = default_stats()
+    at_j = db.globalId[rows] == j
+    train_rows = rows[at_j & (fold_of_row != i)]
+    with stats.stage('train') as timer:
+        timer.count(len(train_rows), int((db.offsets[train_rows + 1] - db.offsets[train_rows]).sum()))
+        if share_counts:
+            # the counts of the folds at position j, shared by the units of position j run in this process
+            if _samepos_counts.get('key') != (id(job), j):
+                fold_counts = [count_ngrams(*db.select(rows[at_j & (fold_of_row == k)]), vocab_size=len(db.vocab), order=order)
+                    for k in range(0, len(foldIds))]
+                _samepos_counts.update(key=(id(job), j), folds=fold_counts, total=merge_counts(fold_counts, len(db.vocab)))
+            keys, counts = subtract_counts(_samepos_counts['total'], _samepos_counts['folds'][i], len(db.vocab))
+            lm = default_cache().estimate_lm(db.vocab, keys, counts)
+        else:
+            ids, offsets = db.select(train_rows)
+            lm = default_cache().train_lm_ids(db.vocab, ids, offsets, order=order)
+    # compute sentence entropy
+    test_rows = rows_by_conv(db, rows[at_j & (fold_of_row == i)], foldIds[i])
+    with stats.stage('score') as timer:
+        ents, scores = score_entropy(lm, db.select(test_rows), timer, with_tokens=tokens is not None)
+    if tokens is not None:
+        with stats.stage('write', sentences=len(test_rows)):
+            write_chunk(tokens, unit, db.convId[test_rows], db.globalId[test_rows], *scores)
+    return [(int(db.convId[r]), j, ent) for r, ent in zip(test_rows, ents)]
+
+def _samepos_worker(args):
+    inputfile, sent_n, share_counts, store_dir, units, order, tokens = args
+    store = JobStore(store_dir)
+    job = samepos_job(inputfile, sent_n, store, order, tokens)
+    cache = default_cache()
+    hits, misses = cache.hits, cache.misses
+    run_units(store, units, lambda unit: samepos_unit(job, unit, share_counts, order, tokens), wait=False)
+    return cache.hits - hits, cache.misses - misses, default_stats().take()
+
+
+##
+# Compute the information content of sentence using cross-validation
+# LMs are trained per sentence position, i.e., 100 models trained for the first 100 sentences respectively
+def crossvalidate_samepos(inputfile, outputfile, sent_n=100, share_counts=True, store=None, workers=1, order=3,
+        tokens=None, norm=False):
+    """
+    inputfile: a text db csv, or one compiled by corpus_db.compile_textdb
+    share_counts: count n-grams once per (position, fold), and build each fold's model from
+        the counts of all folds minus those of the held-out fold, instead of recounting nine folds
+    store: the folder where the rows of each finished (fold, position) unit are kept, outputfile + '.jobs' by default
+        a rerun skips the units done before; several runs, e.g., on hosts sharing the folder, may work on it at once
+    workers: the number of processes that run units in parallel
+    order: the n-gram order of the LMs
+    tokens: a folder that the per-token scores are also written to, see token_store
+        a job store is made for one order and tokens folder
+    norm: also write the NORM_COLUMNS, in two passes over outputfile once the units are merged
+    """
+    store = JobStore(store or outputfile + '.jobs')
+    job = samepos_job(inputfile, sent_n, store, order, tokens)
+    foldN = len(job[2])
+
+    # estimate information content using cross-validation
+    # for each sentence position, and then each fold
+    units = [unit_name(i, j) for j in range(1, sent_n+1) for i in range(0, foldN)]
+    if workers > 1:
+        # each worker starts at a different position, and takes the units no other worker has claimed
+        starts = [len(units) * k // workers for k in range(0, workers)]
+        pool = Pool(processes=workers)
+        try:
+            worker_results = pool.map(_samepos_worker,
+                [(inputfile, sent_n, share_counts, store.store_dir, units[s:] + units[:s], order, tokens) for s in starts])
+        finally:
+            pool.close()
+            pool.join()
+        for hits, misses, stages in worker_results:
+            default_cache().hits += hits
+            default_cache().misses += misses
+            default_stats().merge(stages)
+    # run the units left, and wait for those held by other runs
+    run_units(store, units, lambda unit: samepos_unit(job, unit, share_counts, order, tokens))
+    print('\nDone for %s' % inputfile)
+
+    # write results to outputfile, fold by fold
+    with default_stats().stage('write'):
+        merged = [unit_name(i, j) for i in range(0, foldN) for j in range(1, sent_n+1)]
+        store.merge(merged, outputfile, ['convId', 'globalId', 'ent'])
+        if tokens is not None:
+            write_index(tokens, merged, job[0].vocab)
+        if norm:
+            write_ent_norm(outputfile, word_nums=lambda cids, gids: row_word_nums(job[0], cids, gids))
 
 
 ##
 # compute the entropy using LM trained from an external file
-def externalTrain(testfile, trainfile, outputfile):
-    # read text from trainfile, and write to a temporary file
-    with open(trainfile, 'r') as fr, open('data/lm/train.txt', 'w') as fw:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            text = items[4]
-            fw.write(text + '\n')
-    # train the LM
-    lmfile = 'data/lm/train.lm'
-    srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-    train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', 'data/lm/train.txt', '-lm', lmfile]
-    FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-    return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-    if return_code != 0:
-        raise Exception('trainning failed')
-
-    # read text from testfile and compute entropy
-    lm = initLM(3)
-    readLM(lm, lmfile)
-    results = []
-    with open(testfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[0]), int(items[3]), items[4]
-            ent = sentence_entropy(lm, text)
-            results.append((cid, gid, ent))
+def externalTrain(testfile, trainfile, outputfile, incremental=False, order=3, norm=False):
+    """
+    incremental: score only the sentences of testfile that are new or changed since outputfile was
+        written by the LM of the same training text, see update_entropy
+    order: the n-gram order of the LM
+    norm: also write the NORM_COLUMNS, see write_entropy
+    """
+    stats = default_stats()
+    # read text from trainfile
+    with stats.stage('read') as timer:
+        traintext = read_csv_columns(trainfile, ['rawWord'])['rawWord']
+        timer.count(len(traintext))
+    # train the LM, only if there are sentences to score
+    def train():
+        with stats.stage('train', sentences=len(traintext)):
+            return default_cache().train_lm(traintext, order=order)
+    # compute the entropy of testfile
+    if incremental:
+        update_entropy(train, lm_key(traintext, order=order)[:16], testfile, outputfile, norm=norm)
+    else:
+        write_entropy(train(), testfile, outputfile, norm=norm)
 
-    # write results to outputfile
+
+##
+# compute the entropy of the sentences in testfile chunk by chunk, so that memory use is bounded
+def write_entropy(lm, testfile, outputfile, chunksize=100000, order=None, tokens=None, norm=False):
+    """
+    order: the highest n-gram order used in scoring, defaults to the LM's
+    tokens: a folder that the per-token scores are also written to, a chunk of testfile at a time
+    norm: also write the NORM_COLUMNS; the mean entropy by length is summed up while scoring,
+        and ent_norm is added in a second streaming pass over outputfile
+    """
+    stats = default_stats()
+    chunks = read_csv_chunks(testfile, ['convId', 'globalId', 'rawWord'],
+        types={'convId': int, 'globalId': int}, chunksize=chunksize)
+    names = []
+    means = LengthMeans()
     with open(outputfile, 'w') as fw:
         csvwriter = csv.writer(fw, delimiter=',')
-        csvwriter.writerow(['convId', 'globalId', 'ent'])
-        for row in results:
-            csvwriter.writerow(row)
+        csvwriter.writerow(['convId', 'globalId', 'ent'] + (['wordNum'] if norm else []))
+        for chunk in stats.timed('read', chunks, lambda chunk: len(chunk['rawWord'])):
+            with stats.stage('score') as timer:
+                ents, scores = score_entropy(lm, chunk['rawWord'], timer, order, with_tokens=tokens is not None)
+            with stats.stage('write', sentences=len(ents)):
+                if norm:
+                    lengths = [len(text.split()) for text in chunk['rawWord']]
+                    means.add(ents, lengths)
+                    csvwriter.writerows(zip(chunk['convId'].tolist(), chunk['globalId'].tolist(), ents, lengths))
+                else:
+                    csvwriter.writerows(zip(chunk['convId'].tolist(), chunk['globalId'].tolist(), ents))
+                if tokens is not None:
+                    names.append('chunk%05d' % len(names))
+                    write_chunk(tokens, names[-1], chunk['convId'], chunk['globalId'], *scores)
+    if tokens is not None:
+        write_index(tokens, names, lm.vocab)
+    if norm:
+        with stats.stage('write'):
+            write_ent_norm(outputfile, means, chunksize=chunksize)
 
+##
+# write_entropy, scoring only the rows of testfile that model has not scored before with the same text,
+# and copying the entropy of the others from the cover file of outputfile, where all rows are then recorded
+def update_entropy(get_lm, model, testfile, outputfile, chunksize=100000, order=None, tokens=None, norm=False):
+    """
+    get_lm: a function that returns the LM, called only if there are sentences to score
+    model: the id of the LM and the order it scores with, e.g., score_cover.file_digest of its file
+    tokens: a folder that the per-token scores are also written to, as in write_entropy;
+        as the cover file does not keep them, all sentences are scored
+    norm: also write the NORM_COLUMNS, as in write_entropy
+    return: the number of sentences scored
+    """
+    stats = default_stats()
+    with stats.stage('read'):
+        covered = read_cover(outputfile, model) if tokens is None else {}
+    chunks = read_csv_chunks(testfile, ['convId', 'globalId', 'rawWord'],
+        types={'convId': int, 'globalId': int}, chunksize=chunksize)
+    lm = []
+    names = []
+    means = LengthMeans()
+    scored, total = 0, 0
+    with atomic_write(outputfile) as fw, atomic_write(cover_path(outputfile)) as fc:
+        csvwriter = csv.writer(fw, delimiter=',')
+        csvwriter.writerow(['convId', 'globalId', 'ent'] + (['wordNum'] if norm else []))
+        coverwriter = csv.writer(fc, delimiter=',')
+        coverwriter.writerow(COVER_COLUMNS + ['ent'])
+        for chunk in stats.timed('read', chunks, lambda chunk: len(chunk['rawWord'])):
+            cids, gids, texts = chunk['convId'].tolist(), chunk['globalId'].tolist(), chunk['rawWord']
+            keys = [(cid, gid, text_hash(text)) for cid, gid, text in zip(cids, gids, texts)]
+            ents = [covered.get(key, [None])[0] for key in keys]
+            todo = [k for k, ent in enumerate(ents) if ent is None]
+            if todo:
+                if not lm:
+                    lm.append(get_lm())
+                with stats.stage('score') as timer:
+                    todo_ents, scores = score_entropy(lm[0], [texts[k] for k in todo], timer, order,
+                        with_tokens=tokens is not None)
+                    for k, ent in zip(todo, todo_ents):
+                        ents[k] = ent
+            with stats.stage('write', sentences=len(ents)):
+                if norm:
+                    lengths = [len(text.split()) for text in texts]
+                    means.add([float(ent) for ent in ents], lengths)
+                    csvwriter.writerows(zip(cids, gids, ents, lengths))
+                else:
+                    csvwriter.writerows(zip(cids, gids, ents))
+                coverwriter.writerows(key + (model, ent) for key, ent in zip(keys, ents))
+                if tokens is not None and todo:
+                    names.append('chunk%05d' % len(names))
+                    write_chunk(tokens, names[-1], cids, gids, *scores)
+            scored += len(todo)
+            total += len(keys)
+    if tokens is not None and lm:
+        write_index(tokens, names, lm[0].vocab)
+    if norm:
+        with stats.stage('write'):
+            write_ent_norm(outputfile, means, chunksize=chunksize)
+    print('%s of %s sentences scored, the others copied from %s' % (scored, total, cover_path(outputfile)))
+    return scored
+
+
+##
+# the UnigramTable of a training file, counted once per process and reused for every test file
+_unigram_tables = {}
+def unigram_table(trainfile):
+    if trainfile not in _unigram_tables:
+        stats = default_stats()
+        table = UnigramTable()
+        for chunk in stats.timed('read', read_csv_chunks(trainfile, ['rawWord']), lambda chunk: len(chunk['rawWord'])):
+            with stats.stage('train', sentences=len(chunk['rawWord'])):
+                table.add(chunk['rawWord'])
+        _unigram_tables[trainfile] = table
+    return _unigram_tables[trainfile]
 
 ##
 # Compute infomation content using only unigrams existed in the training vocabulary
-def externalTrain_invocab(testfile, trainfile, outputfile):
-    # read text from trainfile, and insert frequency into a dict
-    wordsdict = {}
-    with open(trainfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            for w in items[4].split():
-                if w in wordsdict:
-                    wordsdict[w] += 1
-                else:
-                    wordsdict[w] = 1
-    # get total frequency
-    wordsN = sum(val for val in wordsdict.itervalues())
-    # compute
-    results = []
-    with open(testfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[0]), int(items[3]), items[4]
-            probs = []
-            for w in text.split():
-                if w in wordsdict:
-                    p = float(wordsdict[w]) / wordsN
-                    probs.append(-math.log(p))
-            if len(probs) > 0:
-                ent = sum(probs) / len(probs)
-                results.append((cid, gid, ent, float(len(probs))/len(text.split())))
-            else:
-                results.append((cid, gid, 'NA', 0))
-    # write results to outputfile
+def externalTrain_invocab(testfile, trainfile, outputfile, chunksize=100000):
+    """
+    trainfile: a text db csv, or a ngram_lm.UnigramTable already counted
+    """
+    stats = default_stats()
+    table = trainfile if isinstance(trainfile, UnigramTable) else unigram_table(trainfile)
+    # compute the mean -log p of in-vocab words, a chunk of test sentences at a time
+    testchunks = read_csv_chunks(testfile, ['convId', 'globalId', 'rawWord'],
+        types={'convId': int, 'globalId': int}, chunksize=chunksize)
     with open(outputfile, 'w') as fw:
         csvwriter = csv.writer(fw, delimiter=',')
         csvwriter.writerow(['convId', 'globalId', 'ent', 'inVocabProp'])
-        for row in results:
-            csvwriter.writerow(row)
+        for chunk in stats.timed('read', testchunks, lambda chunk: len(chunk['rawWord'])):
+            with stats.stage('score', sentences=len(chunk['rawWord'])):
+                ents, props = table.score_invocab(chunk['rawWord'])
+            with stats.stage('write', sentences=len(ents)):
+                for cid, gid, ent, prop in zip(chunk['convId'].tolist(), chunk['globalId'].tolist(),
+                        ents.tolist(), props.tolist()):
+                    csvwriter.writerow((cid, gid, ent, prop) if prop > 0 else (cid, gid, 'NA', 0))
 
 
 ##
 # Train LM using external sentences of same position
-def externalTrain_samepos(testfile, trainfile, outputfile):
+def externalTrain_samepos(testfile, trainfile, outputfile, order=3, norm=False):
+    """
+    norm: also write the NORM_COLUMNS
+    """
+    stats = default_stats()
     # read text from trainfile into a dict
     # and key is sentence position, and value is text
     traintext = {}
-    with open(trainfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            gid, text = int(items[3]), items[4]
-            if gid in traintext:
-                traintext[gid].append(text)
-            else:
-                traintext[gid] = [text]
+    trainchunks = read_csv_chunks(trainfile, ['globalId', 'rawWord'], types={'globalId': int})
+    for chunk in stats.timed('read', trainchunks, lambda chunk: len(chunk['rawWord'])):
+        for gid, text in zip(chunk['globalId'].tolist(), chunk['rawWord']):
+            traintext.setdefault(gid, []).append(text)
 
     # read text from testfile into a dict
     # where key is sentence position, and value is a dict {cid -> text}
+    # (the first row of testfile is skipped)
     testtext = {}
-    with open(testfile, 'r') as fr:
-        fr.next()
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[0]), int(items[3]), items[4]
-            if gid in testtext:
-                testtext[gid][cid] = text
-            else:
-                testtext[gid] = {cid: text}
+    with stats.stage('read') as timer:
+        data = read_csv_columns(testfile, ['convId', 'globalId', 'rawWord'], types={'convId': int, 'globalId': int})
+        timer.count(len(data['rawWord']))
+    for cid, gid, text in list(zip(data['convId'].tolist(), data['globalId'].tolist(), data['rawWord']))[1:]:
+        testtext.setdefault(gid, {})[cid] = text
 
     # train LM and compute entropy
     results = []
+    lengths = []
     for gid in range(1, 101):
         # train the LM
-        tmpfile = 'data/lm/train.txt'
-        with open(tmpfile, 'w') as fw:
-            for text in traintext[gid]:
-                fw.write(text + '\n')
-        lmfile = 'data/lm/train.lm'
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', tmpfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed')
+        with stats.stage('train', sentences=len(traintext[gid])):
+            lm = default_cache().train_lm(traintext[gid], order=order)
         # compute
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        for cid, text in testtext[gid].iteritems():
-            ent = sentence_entropy(lm, text)
+        cids = list(testtext[gid].keys())
+        with stats.stage('score') as timer:
+            logprobs, offsets = score_sentences(lm, [testtext[gid][cid] for cid in cids])
+            ents = entropy_from_scores(logprobs, offsets).tolist()
+            timer.count_scores(logprobs, offsets)
+        for cid, ent in zip(cids, ents):
             results.append((cid, gid, ent))
+        # the words of each sentence, not counting </s>
+        lengths += (np.diff(offsets) - 1).tolist()
         # print progress
         sys.stdout.write('\r%s/%s sentence positions done' % (gid, 100))
         sys.stdout.flush()
 
+    if norm:
+        results = add_ent_norm(results, lengths)
+
     # write results to outputfile
-    with open(outputfile, 'w') as fw:
+    with stats.stage('write', sentences=len(results)), open(outputfile, 'w') as fw:
         csvwriter = csv.writer(fw, delimiter=',')
-        csvwriter.writerow(['convId', 'globalId', 'ent'])
+        csvwriter.writerow(['convId', 'globalId', 'ent'] + (NORM_COLUMNS if norm else []))
         for row in results:
             csvwriter.writerow(row)
     # print
@@ -363,24 +639,27 @@ def externalTrain_samepos(testfile, trainfile, outputfile):
 
 ##
 # Compute entropy using already trained LM
-def externalLM(testfile, lmfile, outputfile):
-    # load the LM, read text from testfile, and compute entropy
-    lm = initLM(3)
-    readLM(lm, lmfile)
-    results = []
-    with open(testfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[0]), int(items[3]), items[4]
-            ent = sentence_entropy(lm, text)
-            results.append((cid, gid, ent))
-    # write results to outputfile
-    with open(outputfile, 'w') as fw:
-        csvwriter = csv.writer(fw, delimiter=',')
-        csvwriter.writerow(['convId', 'globalId', 'ent'])
-        for row in results:
-            csvwriter.writerow(row)
+def externalLM(testfile, lmfile, outputfile, incremental=False, order=None, tokens=None, norm=False):
+    """
+    lmfile: an ARPA file, or one compiled by ngram_lm.compile_arpa
+    incremental: score only the sentences of testfile that are new or changed since outputfile was
+        written by the same lmfile, see update_entropy
+    order: the highest n-gram order used in scoring, e.g., 3 with a 5-gram model; defaults to the model's
+    tokens: a folder that the per-token scores are also written to, see token_store
+    norm: also write the NORM_COLUMNS, see write_entropy
+    """
+    # load the LM, only if there are sentences to score
+    def load():
+        with default_stats().stage('load'):
+            return load_model(lmfile)
+    # compute the entropy of testfile
+    if incremental:
+        model = file_digest(lmfile)
+        if order is not None:
+            model = '%s.order%s' % (model, order)
+        update_entropy(load, model, testfile, outputfile, order=order, tokens=tokens, norm=norm)
+    else:
+        write_entropy(load(), testfile, outputfile, order=order, tokens=tokens, norm=norm)
 
 
 ##
@@ -433,3 +712,8 @@ if __name__ == '__main__':
     crossvalidate(inputfile='data/SWBD_text_disfrmvd.csv', outputfile='data/SWBD_disfrmvd_entropy_crossvalidate.csv')
     # Swichboard disfluencies-removed text cross-validation same position
     crossvalidate_samepos(inputfile='data/SWBD_text_disfrmvd.csv', outputfile='data/SWBD_disfrmvd_entropy_crossvalidate_samepos.csv')
+
+    # how many of the LMs above were loaded from the cache rather than trained
+    default_cache().report()
+    # where the time went, if run with RUN_STATS=1
+    default_stats().report()
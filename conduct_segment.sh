@@ -1,6 +1,6 @@
 #!/bin/bash
 
-text_file=$1 # first argument is the full path to the text file
+text_file=$1 # first argument is the full path to the text file, or - for stdin
 config_file="config/$2"
 
 cd /Users/yangxu/GitHub/bayes-seg/
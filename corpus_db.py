@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# Compile the text databases (SWBD_text_db.csv, BNC_text_db100_mlrcut.csv, ...) into
+# integer-encoded .npy columns that are memory-mapped when loaded
+# 10/18/2026
+
+from __future__ import print_function
+
+import sys
+import os
+import csv
+import itertools
+import numpy as np
+
+from ngram_lm import Vocab, _to_bytes, _from_bytes, write_vocab, load_vocab
+
+
+# the integer columns kept from the text db, when present
+ID_COLUMNS = ['convId', 'turnId', 'globalId']
+
+
+##
+# An integer-encoded text db, one row per sentence
+class TextDB(object):
+    """
+    vocab: ngram_lm.Vocab, whose ids are used in tokens
+    tokens: int32 array, the word ids of all sentences
+    offsets: int64 array, sentence i is tokens[offsets[i]:offsets[i+1]]
+    columns: dict(name -> int32 array), e.g., convId, turnId, globalId and speaker
+    speakers: list of str, the labels of the speaker codes
+    """
+    def __init__(self, vocab, tokens, offsets, columns, speakers=None):
+        self.vocab = vocab
+        self.tokens = tokens
+        self.offsets = offsets
+        self.columns = columns
+        self.speakers = speakers or []
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def word_num(self):
+        return np.diff(self.offsets)
+
+    def text(self, i):
+        return ' '.join(self.vocab.words[w] for w in self.tokens[self.offsets[i]:self.offsets[i+1]])
+
+    def select(self, rows):
+        """
+        rows: int array (or bool mask) of sentence rows
+        return: (ids, offsets) of those sentences, in the order of rows
+        """
+        rows = np.nonzero(rows)[0] if np.asarray(rows).dtype == bool else np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+        index = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+        return np.asarray(self.tokens[index], dtype=np.int32), offsets
+
+
+# the rows of db that belong to conv_ids, ordered by conv_ids first and by row next
+def rows_by_conv(db, rows, conv_ids):
+    conv_ids = np.asarray(conv_ids, dtype=np.int64)
+    rows = rows[np.isin(db.convId[rows], conv_ids)]
+    perm = np.argsort(conv_ids, kind='mergesort')
+    rank = perm[np.searchsorted(conv_ids[perm], db.convId[rows])]
+    return rows[np.argsort(rank, kind='mergesort')]
+
+
+##
+# stream the rows of a csv file in chunks of typed column arrays
+# fields are parsed by the csv module, so quoted fields may hold commas
+def read_csv_chunks(datafile, columns, types=None, chunksize=100000):
+    """
+    columns: the names of the columns to read, or their positions
+    types: dict(column -> int or float); the other columns are read as str
+    return: a generator of dict(column -> values), with at most chunksize rows each
+        int and float columns are numpy arrays, str columns are lists
+    """
+    types = types or {}
+    with open(datafile, 'r') as fr:
+        reader = csv.reader(fr)
+        header = next(reader)
+        index = [c if isinstance(c, int) else header.index(c) for c in columns]
+        while True:
+            rows = list(itertools.islice(reader, chunksize))
+            if not rows:
+                break
+            chunk = {}
+            for c, k in zip(columns, index):
+                values = [items[k] for items in rows]
+                if types.get(c) is int:
+                    chunk[c] = np.array(values).astype(np.int64)
+                elif types.get(c) is float:
+                    chunk[c] = np.array(values).astype(np.float64)
+                else:
+                    chunk[c] = values
+            yield chunk
+
+##
+# read whole columns of a csv file, see read_csv_chunks
+def read_csv_columns(datafile, columns, types=None):
+    data = dict((c, []) for c in columns)
+    for chunk in read_csv_chunks(datafile, columns, types):
+        for c in columns:
+            data[c].append(chunk[c])
+    for c in columns:
+        if types and types.get(c) in (int, float):
+            data[c] = np.concatenate(data[c]) if data[c] else np.zeros(0, dtype=np.int64 if types[c] is int else np.float64)
+        else:
+            data[c] = [v for values in data[c] for v in values]
+    return data
+
+
+##
+# read a text db csv into a TextDB held in memory
+def read_textdb(datafile, text_col='rawWord'):
+    vocab = Vocab()
+    tokens, offsets = [], [0]
+    values = dict((c, []) for c in ID_COLUMNS)
+    speakers, speaker_codes, speaker_col = {}, [], []
+    with open(datafile, 'r') as fr:
+        reader = csv.reader(fr)
+        header = next(reader)
+        text_idx = header.index(text_col)
+        id_idx = [(c, header.index(c)) for c in ID_COLUMNS if c in header]
+        spk_idx = header.index('speaker') if 'speaker' in header else None
+        for items in reader:
+            for c, k in id_idx:
+                values[c].append(int(items[k]))
+            if spk_idx is not None:
+                spk = items[spk_idx]
+                if spk not in speakers:
+                    speakers[spk] = len(speaker_codes)
+                    speaker_codes.append(spk)
+                speaker_col.append(speakers[spk])
+            tokens.extend(vocab.add(w) for w in items[text_idx].split())
+            offsets.append(len(tokens))
+    columns = dict((c, np.array(values[c], dtype=np.int32)) for c, k in id_idx)
+    if spk_idx is not None:
+        columns['speaker'] = np.array(speaker_col, dtype=np.int32)
+    return TextDB(vocab, np.array(tokens, dtype=np.int32), np.array(offsets, dtype=np.int64), columns, speaker_codes)
+
+
+##
+# compile a text db csv into a directory of .npy files
+def compile_textdb(datafile, dbdir=None, text_col='rawWord'):
+    """
+    dbdir: defaults to datafile with `.csv` replaced by `.npdb`
+    return: dbdir
+    """
+    if dbdir is None:
+        dbdir = os.path.splitext(datafile)[0] + '.npdb'
+    db = read_textdb(datafile, text_col)
+    if not os.path.isdir(dbdir):
+        os.makedirs(dbdir)
+    write_vocab(db.vocab, dbdir)
+    with open(os.path.join(dbdir, 'speakers.txt'), 'wb') as fw:
+        for spk in db.speakers:
+            fw.write(_to_bytes(spk) + b'\n')
+    np.save(os.path.join(dbdir, 'tokens.npy'), db.tokens)
+    np.save(os.path.join(dbdir, 'offsets.npy'), db.offsets)
+    for c, values in db.columns.items():
+        np.save(os.path.join(dbdir, c + '.npy'), values)
+    return dbdir
+
+
+def is_textdb(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'tokens.npy'))
+
+##
+# load a compiled text db with its arrays memory-mapped, or read a csv into memory
+def load_textdb(path, mmap_mode='r'):
+    if not is_textdb(path):
+        return read_textdb(path)
+    vocab = load_vocab(path, mmap_mode)
+    with open(os.path.join(path, 'speakers.txt'), 'rb') as fr:
+        speakers = [_from_bytes(line.rstrip(b'\n')) for line in fr]
+    tokens = np.load(os.path.join(path, 'tokens.npy'), mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+    columns = {}
+    for c in ID_COLUMNS + ['speaker']:
+        colfile = os.path.join(path, c + '.npy')
+        if os.path.exists(colfile):
+            columns[c] = np.load(colfile, mmap_mode=mmap_mode)
+    return TextDB(vocab, tokens, offsets, columns, speakers)
+
+
+##
+# main
+if __name__ == '__main__':
+    # compile the text dbs given on the command line, e.g.,
+    # $ python corpus_db.py data/SWBD_text_db.csv data/BNC_text_db100_mlrcut.csv
+    for datafile in sys.argv[1:]:
+        print('compiled %s to %s' % (datafile, compile_textdb(datafile)))
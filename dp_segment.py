@@ -0,0 +1,97 @@
+#!/usr/local/bin/python3
+# An in-process Bayesian lexical-cohesion segmenter, solved exactly by dynamic programming
+# after Eisenstein & Barzilay (2008), the model behind bayes-seg's dp.config
+# Yang Xu
+# 10/18/2026
+
+import math
+import numpy as np
+
+
+##
+# the words of a conversation as integer ids
+def conversation_tokens(inputlist):
+    """
+    inputlist: a list of str
+    return: (words, offsets, V), the word id of every token, the int64 offsets of each sentence's tokens
+        (sentence i is words[offsets[i]:offsets[i+1]]), and the vocab size
+    """
+    vocab = {}
+    word_ids, offsets = [], [0]
+    for text in inputlist:
+        word_ids.extend(vocab.setdefault(w, len(vocab)) for w in str(text).lower().split())
+        offsets.append(len(word_ids))
+    return np.array(word_ids, dtype=np.int64), np.array(offsets, dtype=np.int64), max(len(vocab), 1)
+
+
+##
+# segment a conversation, returning the 1-indexed sentence positions of segment ends as conduct_segment
+def dp_segment(inputlist, prior=0.1, mean_len=10, num_segs=None, max_len=None):
+    """
+    inputlist: a list of str
+    prior: the symmetric Dirichlet prior of each segment's language model
+    mean_len: the mean of the geometric prior on segment length, used when num_segs is None
+    num_segs: the exact number of segments, if known
+    max_len: the longest segment considered; all lengths by default
+    The likelihoods of all segments take O(n * T log T) time for a conversation of n sentences and T tokens
+    return: a list of int, the last one being len(inputlist)
+    """
+    n = len(inputlist)
+    if n == 0:
+        return []
+    words, tot, V = conversation_tokens(inputlist)
+    max_len = n if max_len is None else min(max_len, n)
+
+    # log-gamma terms of the Dirichlet-compound multinomial, tabulated over the integer counts
+    maxcount = int(np.bincount(words).max()) if len(words) else 0
+    lg_word = np.array([math.lgamma(k + prior) - math.lgamma(prior) for k in range(maxcount + 1)])
+    lg_total = np.array([math.lgamma(k + V * prior) for k in range(int(tot[-1]) + 1)])
+    lg_norm = math.lgamma(V * prior)
+
+    # seg_ll(j)[i - lo]: the log-likelihood of the segment of sentences i..j-1, for all i in lo..j-1 at once,
+    # from the tokens of sentences lo..j-1 only: taking the tokens from the last one back, the k-th occurrence
+    # of a word adds lg_word[k] - lg_word[k-1], so the word terms of each segment are a suffix sum over sentences
+    def seg_ll(j):
+        lo = max(j - max_len, 0)
+        w = words[tot[lo]:tot[j]][::-1]
+        sent = np.repeat(np.arange(j - 1, lo - 1, -1), np.diff(tot[lo:j+1])[::-1])
+        order = np.argsort(w, kind='mergesort')
+        sorted_w = w[order]
+        first = np.r_[True, sorted_w[1:] != sorted_w[:-1]]
+        k = np.empty(len(w), dtype=np.int64)
+        k[order] = np.arange(len(w)) - np.maximum.accumulate(np.where(first, np.arange(len(w)), 0)) + 1
+        gain = np.bincount(sent - lo, weights=lg_word[k] - lg_word[k - 1], minlength=j - lo)
+        return lg_norm - lg_total[tot[j] - tot[lo:j]] + np.cumsum(gain[::-1])[::-1]
+
+    if num_segs is None:
+        # the geometric prior on segment length, i.e., a boundary after each sentence with probability q
+        q = 1.0 / mean_len
+        lengths = np.arange(max_len, 0, -1)
+        best = np.zeros(n + 1)
+        back = np.zeros(n + 1, dtype=np.int64)
+        for j in range(1, n + 1):
+            lo = max(j - max_len, 0)
+            ll = best[lo:j] + seg_ll(j) + math.log(q) + (lengths[max_len - (j - lo):] - 1) * math.log(1 - q)
+            back[j] = lo + int(np.argmax(ll))
+            best[j] = ll.max()
+        ends = [n]
+        while back[ends[-1]] > 0:
+            ends.append(int(back[ends[-1]]))
+        return ends[::-1]
+
+    # exactly num_segs segments: best[k][j] is the best split of sentences 0..j-1 into k segments
+    K = min(num_segs, n)
+    lls = [None] + [seg_ll(j) for j in range(1, n + 1)]
+    best = np.full((K + 1, n + 1), -np.inf)
+    best[0, 0] = 0
+    back = np.zeros((K + 1, n + 1), dtype=np.int64)
+    for k in range(1, K + 1):
+        for j in range(k, n + 1):
+            lo = max(j - max_len, 0)
+            ll = best[k-1, lo:j] + lls[j]
+            back[k, j] = lo + int(np.argmax(ll))
+            best[k, j] = ll.max()
+    ends = [n]
+    for k in range(K, 1, -1):
+        ends.append(int(back[k, ends[-1]]))
+    return ends[::-1]
@@ -5,8 +5,6 @@
 # 3/3/2017
 
 from __future__ import print_function
-from nltk.probability import FreqDist
-from nltk.util import ngrams
 from random import shuffle
 
 import math
@@ -15,26 +13,23 @@ import sys
 import os
 import csv
 import itertools
-import subprocess
 
 sys.path.append('..')
-from srilm import *
+from ngram_lm import score_sentences, entropy_from_scores, ppl_from_scores
+from lm_cache import LMCache
+from corpus_db import read_csv_chunks, load_textdb, rows_by_conv
+
+# the LM cache shared with the scripts in the parent folder
+lm_cache = LMCache(cache_dir='../data/lm/cache')
 
 
 # the function that reads text data
-def read_text_data(datafile, cid_col=0, gid_col=3, text_col=4):
+def read_text_data(datafile, cid_col='convId', gid_col='globalId', text_col='rawWord'):
     data = {}
-    with open(datafile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = int(items[cid_col]), int(items[gid_col]), items[text_col]
-            if cid in data:
-                if text != '':
-                    data[cid].append((gid, text))
-            else:
-                if text != '':
-                    data[cid] = [(gid, text)]
+    for chunk in read_csv_chunks(datafile, [cid_col, gid_col, text_col], types={cid_col: int, gid_col: int}):
+        for cid, gid, text in zip(chunk[cid_col].tolist(), chunk[gid_col].tolist(), chunk[text_col]):
+            if text != '':
+                data.setdefault(cid, []).append((gid, text))
     return data
 
 # the function that get all unigrams from data for a list of convIds
@@ -53,32 +48,36 @@ def get_sentences(data, conv_ids):
             sents.append(item[1])
     return sents
 
-# compute sentence entropy
-# adding <s> to the left, and </s> to the right
-def sentence_entropy(lm, text):
-    words = text.split()
-    trigrams = list(ngrams(words, 3, pad_left=True, left_pad_symbol='<s>', pad_right=True, right_pad_symbol='</s>'))
-    trigrams = trigrams[1:-1]
-    probs = [-getTrigramProb(lm, ' '.join(gram)) for gram in trigrams]
-    ent = float(sum(probs)) / len(probs)
-    return ent
+# the mean of values within each sentence, given the sentence offsets
+def sentence_means(values, offsets):
+    sid = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return np.bincount(sid, weights=values, minlength=len(offsets) - 1) / np.diff(offsets)
 
 
 
+##
+# the add-1 smoothed log probabilities of all the words in a vocab, given the ids of the training tokens
+# i.e., (count + 1) / (N + 1), which is 1 / (N + 1) for the words unseen in training
+def unigram_logprobs(ids, vocab_size):
+    counts = np.bincount(ids, minlength=vocab_size)
+    return np.log(counts + 1.0) - math.log(len(ids) + 1)
+
+
 ##
 # Estimate information content using negative log probability of unigram
 # as used by Priva, 2016 (Not so fast ...)
 # The probability of unigram is estimated by the observed frequency
 # with add-1 smooth for zero counts
 def unigram_freq(inputfile, outputfile):
-    # read data
-    alldata = read_text_data(inputfile)
+    # read data, with the sentences encoded as word ids
+    db = load_textdb(inputfile)
+    rows = np.nonzero(db.word_num() > 0)[0]
 
     # prepare folds
-    convIds = alldata.keys()
+    convIds = np.unique(db.convId[rows]).tolist()
     shuffle(convIds)
     foldN = 10
-    foldLen = len(convIds) / foldN
+    foldLen = len(convIds) // foldN
     foldIds = {}
     for i in range(0, foldN):
         if i < foldN-1:
@@ -89,27 +88,14 @@ def unigram_freq(inputfile, outputfile):
     # estimate information content using cross-validation
     results = []
     for i in range(0, foldN):
-        train_cids = []
-        for j in range(0, i) + range(i+1, foldN):
-            train_cids += foldIds[j]
-        fdist = FreqDist(get_unigrams(alldata, train_cids))
-        # compute negative log probability
-        for cid_idx, cid in enumerate(foldIds[i]):
-            for item in alldata[cid]:
-                gid, text = item[0], item[1]
-                neglogprob = []
-                for w in text.split():
-                    if w in fdist:
-                        p = float(fdist[w]+1) / (fdist.N()+1)
-                        neglogprob.append(-math.log(p))
-                    else:
-                        p = 1 / float(fdist.N()+1)
-                        neglogprob.append(-math.log(p))
-                meanval = float(sum(neglogprob)) / len(neglogprob)
-                results.append((cid, gid, meanval))
-            # print
-            sys.stdout.write('\r%s/%s of fold %s done' % (cid_idx, len(foldIds[i]), i+1))
-            sys.stdout.flush()
+        # the log probability table of the words counted in the other folds
+        train_ids, _ = db.select(rows[~np.isin(db.convId[rows], foldIds[i])])
+        logprobs = unigram_logprobs(train_ids, len(db.vocab))
+        # compute mean negative log probability
+        test_rows = rows_by_conv(db, rows, foldIds[i])
+        ids, offsets = db.select(test_rows)
+        meanvals = sentence_means(-logprobs[ids], offsets).tolist()
+        results.extend(zip(db.convId[test_rows].tolist(), db.globalId[test_rows].tolist(), meanvals))
         print('fold %s done.' % (i+1))
 
     # write results to outputfile
@@ -122,7 +108,7 @@ def unigram_freq(inputfile, outputfile):
 
 ##
 # Estimate information content using negative log probability of unigram
-# and the probability is estimated by the unigram language model trained via SRILM
+# and the probability is estimated by the unigram language model trained in-process with SRILM's defaults
 def unigram_srilm(inputfile, outputfile):
     # read all data from inputfile
     alldata = read_text_data(inputfile)
@@ -146,35 +132,18 @@ def unigram_srilm(inputfile, outputfile):
         for j in range(0, i) + range(i+1, foldN):
             train_cids += foldIds[j]
         train_sents = get_sentences(alldata, train_cids)
-        # write train_sents to trainfile
-        trainfile = '../data/lm/train.txt'
-        with open(trainfile, 'w') as fw:
-            for s in train_sents:
-                fw.write(s + '\n')
         # train the LM
-        lmfile = '../data/lm/train.lm'
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed')
+        lm = lm_cache.train_lm(train_sents, order=3)
         # compute mean information content for each sentence in test set
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        for k, cid in enumerate(foldIds[i]):
-            for item in alldata[cid]:
-                gid, text = item[0], item[1]
-                neglogprob = []
-                for w in text.split():
-                    neglogprob.append(-getUnigramProb(lm, w))
-                meanval = float(sum(neglogprob)) / len(neglogprob)
-                ppl = getSentencePpl(lm, text, len(text.split()))
-                ent = sentence_entropy(lm, text)
-                results.append((cid, gid, meanval, ppl, ent))
-            # print
-            sys.stdout.write('\r%s/%s of fold %s done' % (k+1, len(foldIds[i]), i+1))
-            sys.stdout.flush()
+        rows = [(cid, item[0]) for cid in foldIds[i] for item in alldata[cid]]
+        ids, offsets = lm.encode(get_sentences(alldata, foldIds[i]))
+        unigram_lp = lm.logprob_ids(np.zeros((len(ids), 0), dtype=np.int64), ids)
+        meanvals = sentence_means(-unigram_lp, offsets).tolist()
+        logprobs, lp_offsets = score_sentences(lm, (ids, offsets))
+        ppls = ppl_from_scores(logprobs, lp_offsets).tolist()
+        ents = entropy_from_scores(logprobs, lp_offsets).tolist()
+        for k, (cid, gid) in enumerate(rows):
+            results.append((cid, gid, meanvals[k], ppls[k], ents[k]))
         print('fold %s done.' % (i+1))
 
     # write results to outputfile
@@ -191,3 +160,4 @@ if __name__ == '__main__':
     # unigram_freq(inputfile='../data/SWBD_text_db.csv', outputfile='../data/SWBD_infocont_unifreq.csv')
 
     unigram_srilm(inputfile='../data/SWBD_text_db.csv', outputfile='../data/SWBD_infocont_unisrilm.csv')
+    lm_cache.report()
@@ -8,29 +8,26 @@ from __future__ import print_function
 import sys
 sys.path.append('..')
 
-import subprocess
 import csv
-import math
-import os
+import numpy as np
 
 from random import shuffle
-from srilm import *
+from ngram_lm import score_sentences, ppl_from_scores
+from lm_cache import LMCache
+from corpus_db import read_csv_chunks
+
+# the LM cache shared with the scripts in the parent folder
+lm_cache = LMCache(cache_dir='../data/lm/cache')
 
 
 ##
 # compute entropy by 10-fold cross-validation
-def crossvalidate(inputfile, outputfile):
+def crossvalidate(inputfile, outputfile, order=3):
     # read all text data
     alldata = {}
-    with open(inputfile, 'r') as fr:
-        fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            cid, gid, text = items[0], int(items[1]), items[2]
-            if cid in alldata:
-                alldata[cid].append((gid, text))
-            else:
-                alldata[cid] = [(gid, text)]
+    for chunk in read_csv_chunks(inputfile, [0, 1, 2], types={1: int}):
+        for cid, gid, text in zip(chunk[0], chunk[1].tolist(), chunk[2]):
+            alldata.setdefault(cid, []).append((gid, text))
 
     # prepare folds
     convIds = alldata.keys()
@@ -59,35 +56,15 @@ def crossvalidate(inputfile, outputfile):
         traintext = []
         for j in range(0, i) + range(i+1, foldN):
             traintext += readtext(alldata, foldIds[j])
-        # write traintext to file
-        trainfile = '../data/lm/train_fold%s.txt' % i
-        with open(trainfile, 'w') as fw:
-            for row in traintext:
-                fw.write(row + '\n')
-        # train the lm
-        lmfile = '../data/lm/lm_fold%s.lm' % i
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed for fold %s' % i)
+        # train the lm, served from the LM cache when the same folds were trained before
+        lm = lm_cache.train_lm(traintext, order=order)
         print('training done for fold %s' % i)
-        # compute entropy
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        for cid in foldIds[i]:
-            for row in alldata[cid]:
-                gid, text = row[0], row[1]
-                try:
-                    ppl = getSentencePpl(lm, text, len(text.split()))
-                except Exception as e:
-                    print('fileId: %s' % cid)
-                    print('sentId: %s' % gid)
-                    raise
-                else:
-                    ent = math.log(ppl, 10)
-                    entropy_results.append((cid, gid, ent))
+        # compute entropy, the log10 of the sentence perplexity as getSentencePpl gives it
+        rows = [(cid, row[0]) for cid in foldIds[i] for row in alldata[cid]]
+        logprobs, offsets = score_sentences(lm, [row[1] for cid in foldIds[i] for row in alldata[cid]])
+        ents = np.log10(ppl_from_scores(logprobs, offsets)).tolist()
+        for (cid, gid), ent in zip(rows, ents):
+            entropy_results.append((cid, gid, ent))
         print('computing done for fold %s' % i)
 
     # write entropy_results to file
@@ -102,3 +79,4 @@ def crossvalidate(inputfile, outputfile):
 # main
 if __name__ == '__main__':
     crossvalidate(inputfile='../data/lm/wsj_gt10_full.csv', outputfile='../data/wsj_entropy.csv')
+    lm_cache.report()
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# Work units shared by processes, or by hosts over a shared filesystem, through a folder of lease files,
+# with the result rows of each finished unit kept in a file of its own
+# A unit is claimed by creating its lease file exclusively, and it is done once its rows file exists
+# 10/18/2026
+
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import json
+import time
+import errno
+import socket
+import tempfile
+
+
+DEFAULT_LEASE_SECONDS = 3600
+
+
+##
+# make a folder that other workers may be making at the same time
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+class JobStore(object):
+    """
+    store_dir: the folder shared by all the workers of a job, and by its reruns
+    lease_seconds: a lease older than this is taken to be left by a dead worker, and the unit
+        may be claimed again; it should be well above the time a unit takes
+    """
+    def __init__(self, store_dir, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.store_dir = store_dir
+        self.lease_seconds = lease_seconds
+        self.owner = '%s.%s' % (socket.gethostname(), os.getpid())
+        _makedirs(os.path.join(store_dir, 'done'))
+        _makedirs(os.path.join(store_dir, 'leases'))
+
+    def done_path(self, unit):
+        return os.path.join(self.store_dir, 'done', unit + '.csv')
+
+    def lease_path(self, unit):
+        return os.path.join(self.store_dir, 'leases', unit + '.lease')
+
+    def init(self, name, make):
+        """
+        return: the JSON value stored as name, storing make() first if there is none
+            e.g., the folds of a job, which all its workers and reruns must share
+        """
+        path = os.path.join(self.store_dir, name + '.json')
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as fw:
+                    json.dump(make(), fw)
+                # a link fails if the file exists, so the first worker to store it wins
+                os.link(tmp_path, path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            finally:
+                os.remove(tmp_path)
+        with open(path, 'r') as fr:
+            return json.load(fr)
+
+    def is_done(self, unit):
+        return os.path.exists(self.done_path(unit))
+
+    def pending(self, units):
+        return [u for u in units if not self.is_done(u)]
+
+    def claim(self, unit):
+        """
+        return: True if this worker now holds the lease of unit, which is not done yet
+        """
+        if self.is_done(unit):
+            return False
+        path = self.lease_path(unit)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            try:
+                expired = time.time() - os.path.getmtime(path) > self.lease_seconds
+            except OSError:
+                expired = True # released in the meantime
+            if not expired:
+                return False
+            # take over the expired lease: of the workers that try, only one renames it away
+            stale_path = '%s.%s' % (path, self.owner)
+            try:
+                os.rename(path, stale_path)
+            except OSError:
+                return False
+            os.remove(stale_path)
+            return self.claim(unit)
+        with os.fdopen(fd, 'w') as fw:
+            fw.write(self.owner)
+        # the unit may have been finished between the check above and the claim
+        if self.is_done(unit):
+            self.release(unit)
+            return False
+        return True
+
+    def release(self, unit):
+        try:
+            os.remove(self.lease_path(unit))
+        except OSError:
+            pass
+
+    def put(self, unit, rows):
+        """
+        write the result rows of unit, all at once: a unit is either done with all its rows, or not done
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.store_dir, 'done'), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fw:
+                csvwriter = csv.writer(fw, delimiter=',')
+                for row in rows:
+                    csvwriter.writerow(row)
+            os.rename(tmp_path, self.done_path(unit))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def merge(self, units, outputfile, header):
+        """
+        write the rows of units, in that order, to outputfile under header
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(outputfile)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fw:
+                csv.writer(fw, delimiter=',').writerow(header)
+                for unit in units:
+                    with open(self.done_path(unit), 'r') as fr:
+                        fw.write(fr.read())
+            os.rename(tmp_path, outputfile)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+##
+# run func on each of units that is neither done nor held by another worker, and store its rows
+def run_units(store, units, func, wait=True, poll_seconds=10):
+    """
+    units: a list of unit names, run in that order
+    func: takes a unit name, and returns the list of its result rows
+    wait: if the units held by other workers are not done when this worker is through its list,
+        wait for them, and claim those whose leases expire
+    return: the number of units run by this worker
+    """
+    n = 0
+    while True:
+        for unit in units:
+            if not store.claim(unit):
+                continue
+            try:
+                store.put(unit, func(unit))
+            finally:
+                store.release(unit)
+            n += 1
+            # print progress
+            sys.stdout.write('\r%s done, %s units run by %s' % (unit, n, store.owner))
+            sys.stdout.flush()
+        if not wait or not store.pending(units):
+            return n
+        time.sleep(poll_seconds)
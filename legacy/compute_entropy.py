@@ -7,19 +7,73 @@
 from __future__ import print_function
 
 import sys
-import subprocess
 import csv
 import math
 import os
 
 from random import shuffle
+from multiprocessing import Pool
 from srilm import *
+from scratch import scratch_dir, ngram_count
 
 
 
+# the function that read text from alldata for a list of convIds
+def readtext(data, conv_ids):
+    text = []
+    for cid in conv_ids:
+        for row in data[cid]:
+            if row[1] != '':
+                text.append(row[1])
+    return text
+
+##
+# train on all folds but fold i, and compute entropy for fold i
+# the training text is piped to ngram-count, and the LM is written to a scratch directory of the fold's own
+def crossvalidate_fold(alldata, foldIds, i):
+    foldN = len(foldIds)
+    with scratch_dir('fold%s' % i) as tmpdir:
+        traintext = []
+        for j in range(0, i) + range(i+1, foldN):
+            traintext += readtext(alldata, foldIds[j])
+        # train the lm
+        lmfile = os.path.join(tmpdir, 'train.lm')
+        ngram_count(traintext, lmfile)
+        print('training done for fold %s' % i)
+        # compute entropy
+        lm = initLM(3)
+        readLM(lm, lmfile)
+        entropy_results = []
+        for cid in foldIds[i]:
+            for row in alldata[cid]:
+                gid, text = row[0], row[1]
+                try:
+                    ppl = getSentencePpl(lm, text, len(text.split()))
+                except Exception as e:
+                    print('convId: %s' % cid)
+                    print('globalId: %s' % gid)
+                    raise
+                else:
+                    ent = math.log(ppl, 10)
+                    entropy_results.append((cid, gid, ent))
+        deleteLM(lm)
+        print('computing done for fold %s' % i)
+    return entropy_results
+
+# worker processes receive alldata once, when the pool starts
+_worker_data = {}
+def _init_worker(alldata):
+    _worker_data['alldata'] = alldata
+
+def _crossvalidate_fold_worker(args):
+    foldIds, i = args
+    return crossvalidate_fold(_worker_data['alldata'], foldIds, i)
+
+
 ##
 # compute entropy by 10-fold cross-validation
-def crossvalidate(inputfile, outputfile):
+# workers: the number of processes that run folds in parallel
+def crossvalidate(inputfile, outputfile, workers=1):
     # read all text data
     alldata = {}
     with open(inputfile, 'r') as fr:
@@ -44,51 +98,19 @@ def crossvalidate(inputfile, outputfile):
         else:
             foldIds[i] = convIds[i*foldLen:]
 
-    # the function that read text from alldata for a list of convIds
-    def readtext(data, conv_ids):
-        text = []
-        for cid in conv_ids:
-            for row in data[cid]:
-                if row[1] != '':
-                    text.append(row[1])
-        return text
-
-    # conduct cross-validation
+    # conduct cross-validation, merging the folds in order
+    if workers > 1:
+        pool = Pool(processes=min(workers, foldN), initializer=_init_worker, initargs=(alldata,))
+        try:
+            fold_results = pool.map(_crossvalidate_fold_worker, [(foldIds, i) for i in range(0, foldN)])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        fold_results = [crossvalidate_fold(alldata, foldIds, i) for i in range(0, foldN)]
     entropy_results = []
-    for i in range(0, foldN):
-        traintext = []
-        for j in range(0, i) + range(i+1, foldN):
-            traintext += readtext(alldata, foldIds[j])
-        # write traintext to file
-        trainfile = 'data/lm/train_fold%s.txt' % i
-        with open(trainfile, 'w') as fw:
-            for row in traintext:
-                fw.write(row + '\n')
-        # train the lm
-        lmfile = 'data/lm/lm_fold%s.lm' % i
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed for fold %s' % i)
-        print('training done for fold %s' % i)
-        # compute entropy
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        for cid in foldIds[i]:
-            for row in alldata[cid]:
-                gid, text = row[0], row[1]
-                try:
-                    ppl = getSentencePpl(lm, text, len(text.split()))
-                except Exception as e:
-                    print('convId: %s' % cid)
-                    print('globalId: %s' % gid)
-                    raise
-                else:
-                    ent = math.log(ppl, 10)
-                    entropy_results.append((cid, gid, ent))
-        print('computing done for fold %s' % i)
+    for rows in fold_results:
+        entropy_results += rows
 
     # write entropy_results to file
     with open(outputfile, 'w') as fw:
@@ -101,24 +123,17 @@ def crossvalidate(inputfile, outputfile):
 ##
 # compute the entropy using LM trained from an external file
 def externalTrain(testfile, trainfile, outputfile):
-    # read text from trainfile, and write to a temporary file
-    with open(trainfile, 'r') as fr, open('data/lm/train.txt', 'w') as fw:
+    # read text from trainfile, and pipe it to ngram-count
+    with open(trainfile, 'r') as fr, scratch_dir('externalTrain') as tmpdir:
         fr.next()
-        for line in fr:
-            items = line.strip().split(',')
-            text = items[4]
-            fw.write(text + '\n')
-    # train the LM
-    lmfile = 'data/lm/train.lm'
-    srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-    train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', 'data/lm/train.txt', '-lm', lmfile]
-    return_code = subprocess.check_call(train_cmd)
-    if return_code != 0:
-        raise Exception('trainning failed')
+        traintext = (line.strip().split(',')[4] for line in fr)
+        # train the LM
+        lmfile = os.path.join(tmpdir, 'train.lm')
+        ngram_count(traintext, lmfile)
+        lm = initLM(3)
+        readLM(lm, lmfile)
 
     # read text from testfile and compute entropy
-    lm = initLM(3)
-    readLM(lm, lmfile)
     entropy_results = []
     with open(testfile, 'r') as fr:
         fr.next()
@@ -219,22 +234,13 @@ def crossvalidate_samepos(inputfile, outputfile, sentence_n=100):
             for k in range(0, i) + range(i+1, foldN):
                 text = readtext(alldata, foldIds[k], j)
                 traintext += text
-            # write traintext to file
-            trainfile = 'data/lm/train.txt'
-            with open(trainfile, 'w') as fw:
-                for text in traintext:
-                    fw.write(text + '\n')
             # train the LM
-            lmfile = 'data/lm/train.lm'
-            srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-            train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-            FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-            return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-            if return_code != 0:
-                raise Exception('trainning failed for fold %s at sentence position %s' % (i, j))
+            with scratch_dir('fold%s_pos%s' % (i, j)) as tmpdir:
+                lmfile = os.path.join(tmpdir, 'train.lm')
+                ngram_count(traintext, lmfile)
+                lm = initLM(3)
+                readLM(lm, lmfile)
             # compute entropy
-            lm = initLM(3)
-            readLM(lm, lmfile)
             for cid in foldIds[i]:
                 if j in alldata[cid]:
                     gid = j
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# Content-addressed on-disk cache of trained LMs, with a size cap and LRU eviction
+# 10/18/2026
+
+from __future__ import print_function
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+from ngram_lm import train_lm, train_lm_ids, estimate_lm, save_lm, load_lm, _to_bytes
+
+
+DEFAULT_CACHE_DIR = os.environ.get('LM_CACHE_DIR', 'data/lm/cache')
+DEFAULT_MAX_BYTES = int(float(os.environ.get('LM_CACHE_MAX_MB', 2048)) * 2**20)
+
+
+##
+# the cache key of an LM: a hash of its training sentences and training options
+def lm_key(sentences, order=3, discount='gt', mincounts=None, maxcounts=None):
+    """
+    sentences: a list of str
+    """
+    h = hashlib.sha1(_options_bytes('text', order, discount, mincounts, maxcounts))
+    for text in sentences:
+        h.update(_to_bytes(text))
+        h.update(b'\n')
+    return h.hexdigest()
+
+def lm_key_ids(vocab, ids, offsets, order=3, discount='gt', mincounts=None, maxcounts=None):
+    """
+    the key of a model trained by train_lm_ids, which also depends on the vocab
+    """
+    h = hashlib.sha1(_options_bytes('ids', order, discount, mincounts, maxcounts))
+    h.update(_vocab_digest(vocab))
+    h.update(np.ascontiguousarray(ids, dtype=np.int32).tobytes())
+    h.update(np.unique(np.asarray(offsets, dtype=np.int64)).tobytes())
+    return h.hexdigest()
+
+def lm_key_counts(vocab, keys, counts, discount='gt', mincounts=None, maxcounts=None):
+    """
+    the key of a model estimated from n-gram counts, e.g. those shared across folds
+    """
+    h = hashlib.sha1(_options_bytes('counts', len(keys) - 1, discount, mincounts, maxcounts))
+    h.update(_vocab_digest(vocab))
+    for n in range(1, len(keys)):
+        h.update(np.ascontiguousarray(keys[n], dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(counts[n], dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+def _options_bytes(kind, order, discount, mincounts, maxcounts):
+    options = (kind, order, discount, sorted((mincounts or {}).items()), sorted((maxcounts or {}).items()))
+    return _to_bytes(repr(options))
+
+# the digest of a vocab is computed once per vocab size
+def _vocab_digest(vocab):
+    cached = getattr(vocab, '_digest', None)
+    if cached is None or cached[0] != len(vocab):
+        h = hashlib.sha1()
+        for w in vocab.words:
+            h.update(_to_bytes(w))
+            h.update(b'\n')
+        cached = (len(vocab), h.digest())
+        vocab._digest = cached
+    return cached[1]
+
+
+##
+# LMs stored as <key>.npz under cache_dir
+class LMCache(object):
+    """
+    cache_dir: where the models are stored
+    max_bytes: the size cap; the least recently used models are evicted beyond it
+    The size of the cache is kept as a running total, from a scan of cache_dir on the first put
+    plus the models put since; cache_dir is scanned again only when the total goes over max_bytes,
+    which also takes in the models put by other processes
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = None # not known until the first put
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """
+        return: the cached NgramLM, or None
+        """
+        path = self.path(key)
+        try:
+            lm = load_lm(path)
+            os.utime(path, None) # mark as recently used
+        except (IOError, OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return lm
+
+    def put(self, key, lm):
+        if self.max_bytes <= 0:
+            return
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                pass
+        if self.total_bytes is None:
+            self.total_bytes = sum(e[1] for e in self._entries())
+        # write to a temporary file and rename, so that concurrent readers never see a partial model
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        os.close(fd)
+        try:
+            save_lm(lm, tmp_path)
+            size = os.path.getsize(tmp_path)
+            try:
+                replaced = os.path.getsize(self.path(key))
+            except OSError:
+                replaced = 0
+            os.rename(tmp_path, self.path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.total_bytes += size - replaced
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """
+        return: a list of (mtime, size, name) of the models in cache_dir
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def evict(self):
+        """
+        remove the least recently used models until the cache fits in max_bytes
+        """
+        entries = self._entries()
+        total = sum(e[1] for e in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def train_lm(self, sentences, order=3, discount='gt', mincounts=None, maxcounts=None):
+        """
+        train_lm, served from the cache when the same model was trained before
+        """
+        sentences = list(sentences)
+        key = lm_key(sentences, order, discount, mincounts, maxcounts)
+        lm = self.get(key)
+        if lm is None:
+            lm = train_lm(sentences, order, discount, mincounts, maxcounts)
+            self.put(key, lm)
+        return lm
+
+    def train_lm_ids(self, vocab, ids, offsets, order=3, discount='gt', mincounts=None, maxcounts=None):
+        """
+        train_lm_ids, served from the cache when the same model was trained before
+        """
+        key = lm_key_ids(vocab, ids, offsets, order, discount, mincounts, maxcounts)
+        lm = self.get(key)
+        if lm is None:
+            lm = train_lm_ids(vocab, ids, offsets, order, discount, mincounts, maxcounts)
+            self.put(key, lm)
+        return lm
+
+    def estimate_lm(self, vocab, keys, counts, discount='gt', mincounts=None, maxcounts=None):
+        """
+        estimate_lm, served from the cache when the same model was estimated before
+        """
+        key = lm_key_counts(vocab, keys, counts, discount, mincounts, maxcounts)
+        lm = self.get(key)
+        if lm is None:
+            lm = estimate_lm(vocab, keys, counts, discount, mincounts, maxcounts)
+            self.put(key, lm)
+        return lm
+
+    def report(self):
+        print('LM cache %s: %s hits, %s misses' % (self.cache_dir, self.hits, self.misses))
+
+
+##
+# the cache shared by all training call sites in a process
+_default_cache = []
+def default_cache():
+    if not _default_cache:
+        _default_cache.append(LMCache())
+    return _default_cache[0]
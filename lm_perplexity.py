@@ -8,60 +8,72 @@
 from __future__ import print_function
 
 import sys
-import subprocess
 import csv
 import math
 import os
-import re
+import numpy as np
 
 from random import shuffle
-from srilm import *
+from multiprocessing import Pool
 
+from ngram_lm import load_model, corpus_stats, file_stats
+from lm_cache import default_cache
+from run_stats import default_stats
 from comp_info_cont import readtext_2list, readtext_2dict, get_sents_fromlist, get_sents_fromdict
+from comp_info_cont import unit_name, unit_index
+from job_queue import JobStore, run_units
 
 
+##
+# Score a testing set (test_file, one sentence per line) against a LM (lm_file) in one pass
+def model_stats(lm_file, test_file, unk=False):
+    """
+    lm_file: an ARPA file, or one compiled by ngram_lm.compile_arpa
+    unk: score the words not in the vocab as <unk>, as `ngram -ppl -unk`; by default they are OOVs
+    return: ngram_lm.TextStats, with the perplexity, log prob, word/sentence and OOV counts
+    """
+    with default_stats().stage('load'):
+        lm = load_model(lm_file)
+    with default_stats().stage('score') as timer:
+        stats = file_stats(lm, test_file, unk=unk)
+        timer.count(stats.numSentences, stats.numWords)
+    return stats
+
 ##
 # Compute the perplexity of a LM (model_file) on a testing set (test_file)
-def model_ppl(lm_file, test_file, lm_order=3):
-    # load lm
-    lm = initLM(3)
-    readLM(lm, lm_file)
-    # compute perplexity
-    try:
-        ppl = getCorpusPpl(lm, test_file)
-    except Exception as e:
-        raise
-    else:
-        deleteLM(lm)
-        return ppl
-
-def model_oov(lm_file, test_file, lm_order=3, verbose=False):
-    # run command
-    srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-    test_cmd = [srilm_dir + 'ngram', '-lm', lm_file, '-ppl', test_file]
-    try:
-        output = subprocess.check_output(test_cmd, stderr=subprocess.STDOUT)
-        if verbose:
-            print(output)
-        m = re.search(r'[0-9]+(?= OOVs)', output)
-        oovn = int(m.group(0))
-    except Exception as e:
-        raise
-    else:
-        return oovn
+def model_ppl(lm_file, test_file, lm_order=3, unk=False):
+    return model_stats(lm_file, test_file, unk).ppl()
+
+def model_oov(lm_file, test_file, lm_order=3, verbose=False, unk=False):
+    stats = model_stats(lm_file, test_file, unk)
+    if verbose:
+        print('%s sentences, %s words, %s OOVs' % (stats.numSentences, stats.numWords, stats.numOOVs))
+        print('logprob= %s ppl= %s ppl1= %s' % (stats.prob, stats.ppl(), stats.ppl1()))
+    return stats.numOOVs
+
+##
+# Compute the perplexity and the OOVs number of an in-process LM on a list of sentences,
+# in the same way as `ngram -ppl`
+def text_ppl(lm, sentences):
+    with default_stats().stage('score') as timer:
+        stats = corpus_stats(lm, sentences)
+        timer.count(stats.numSentences, stats.numWords)
+    return stats.ppl(), stats.numOOVs
 
 ##
 # get the perplexity of cross-validation
 # return 10 values
 def cv_ppl(data_file, output_file):
     # read data
-    alldata = readtext_2list(data_file)
+    with default_stats().stage('read') as timer:
+        alldata = readtext_2list(data_file)
+        timer.count(sum(len(v) for v in alldata.values()))
 
     # prepare folds
-    convIds = alldata.keys()
+    convIds = list(alldata.keys())
     shuffle(convIds)
     foldN = 10
-    foldLen = len(convIds) / foldN
+    foldLen = len(convIds) // foldN
     foldIds = {}
     for i in range(0, foldN):
         if i < foldN-1:
@@ -73,106 +85,124 @@ def cv_ppl(data_file, output_file):
     results = []
     for i in range(0, foldN):
         traintext = []
-        for j in range(0, i) + range(i+1, foldN):
-            traintext += get_sents_fromlist(alldata, foldIds[j])
-        # write traintext to file
-        trainfile = 'data/lm/train.txt'
-        with open(trainfile, 'w') as f:
-            for row in traintext:
-                f.write(row + '\n')
-        # write testtext to file
+        for j in range(0, foldN):
+            if j != i:
+                traintext += get_sents_fromlist(alldata, foldIds[j])
         testtext = get_sents_fromlist(alldata, foldIds[i])
-        testfile = 'data/lm/test.txt'
-        with open(testfile, 'w') as f:
-            for row in testtext:
-                f.write(row + '\n')
         # train the lm
-        lmfile = 'data/lm/train.lm'
-        srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-        train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-        FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-        return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-        if return_code != 0:
-            raise Exception('trainning failed for fold %s' % i)
+        with default_stats().stage('train', sentences=len(traintext)):
+            lm = default_cache().train_lm(traintext, order=3)
         print('training done for fold %s' % i)
         # compute perplexity and OOVs number
-        lm = initLM(3)
-        readLM(lm, lmfile)
-        ppl = getCorpusPpl(lm, testfile)
-        oovn = model_oov(lm_file=lmfile, test_file=testfile)
+        ppl, oovn = text_ppl(lm, testtext)
         results.append((ppl, oovn))
 
     # write results to output_file
-    with open(output_file, 'w') as f:
+    with default_stats().stage('write'), open(output_file, 'w') as f:
         csvwriter = csv.writer(f, delimiter=',')
         csvwriter.writerow(['ppl', 'oovn'])
         for row in results:
             csvwriter.writerow(row)
 
+##
+# the text and folds of a cv_samepos_ppl job, read once per process
+# the folds are kept in the job store, so that all the workers and reruns of the job share them
+_samepos_jobs = {}
+def samepos_ppl_job(input_file, sent_n, store):
+    """
+    store: job_queue.JobStore
+    return: (alldata, foldIds)
+    """
+    key = (input_file, sent_n, store.store_dir)
+    if key not in _samepos_jobs:
+        params = store.init('job', lambda: {'inputfile': input_file, 'sent_n': sent_n})
+        if params != {'inputfile': input_file, 'sent_n': sent_n}:
+            raise Exception('job store %s was made for %s' % (store.store_dir, params))
+        # read data
+        with default_stats().stage('read') as timer:
+            alldata = readtext_2dict(input_file, sent_n=sent_n)
+            timer.count(sum(len(v) for v in alldata.values()))
+        # prepare folds
+        def make_folds():
+            convIds = list(alldata.keys())
+            shuffle(convIds)
+            foldN = 10
+            foldLen = len(convIds) // foldN
+            folds = []
+            for i in range(0, foldN):
+                if i < foldN-1:
+                    folds.append(convIds[i*foldLen : (i+1)*foldLen])
+                else:
+                    folds.append(convIds[i*foldLen:])
+            return folds
+        foldIds = dict(enumerate(store.init('folds', make_folds)))
+        _samepos_jobs[key] = (alldata, foldIds)
+    return _samepos_jobs[key]
+
+##
+# the work unit (i, j) of cv_samepos_ppl: train the LM on the sentences at position j in
+# all folds but fold i, and compute the perplexity and oovn of the sentences at position j in fold i
+def samepos_ppl_unit(job, unit):
+    alldata, foldIds = job
+    i, j = unit_index(unit)
+    # collect all sentences at position j in other convIds than foldIds[i]
+    traintext = []
+    for k in range(0, len(foldIds)):
+        if k != i:
+            traintext += get_sents_fromdict(alldata, foldIds[k], j)
+    # train the LM
+    with default_stats().stage('train', sentences=len(traintext)):
+        lm = default_cache().train_lm(traintext, order=3)
+    # compute perplexity and oovn
+    testtext = get_sents_fromdict(alldata, foldIds[i], j)
+    ppl, oovn = text_ppl(lm, testtext)
+    return [(i, j, ppl, oovn)]
+
+def _samepos_ppl_worker(args):
+    input_file, sent_n, store_dir, units = args
+    store = JobStore(store_dir)
+    job = samepos_ppl_job(input_file, sent_n, store)
+    cache = default_cache()
+    hits, misses = cache.hits, cache.misses
+    run_units(store, units, lambda unit: samepos_ppl_unit(job, unit), wait=False)
+    return cache.hits - hits, cache.misses - misses, default_stats().take()
+
 ##
 # Get the perplexity of running cross-validation over sentences of same positions
 # The output file has three columns: fold_id, sentence_id, perplexity
-def cv_samepos_ppl(input_file, output_file, sent_n=100):
-    # read data
-    alldata = readtext_2dict(input_file, sent_n=sent_n)
+def cv_samepos_ppl(input_file, output_file, sent_n=100, store=None, workers=1):
+    """
+    store: the folder where the rows of each finished (fold, position) unit are kept, output_file + '.jobs' by default
+        a rerun skips the units done before; several runs, e.g., on hosts sharing the folder, may work on it at once
+    workers: the number of processes that run units in parallel
+    """
+    store = JobStore(store or output_file + '.jobs')
+    job = samepos_ppl_job(input_file, sent_n, store)
+    foldN = len(job[1])
 
-    # prepare folds
-    convIds = alldata.keys()
-    shuffle(convIds)
-    foldN = 10
-    foldLen = len(convIds) / foldN
-    foldIds = {}
-    for i in range(0, foldN):
-        if i < foldN-1:
-            foldIds[i] = convIds[i*foldLen : (i+1)*foldLen]
-        else:
-            foldIds[i] = convIds[i*foldLen:]
-
-    # cross-validation
-    results = []
-    for i in range(0, foldN):
-        # for each sentence position
-        for j in range(1, sent_n+1):
-            # collect all sentences at position j in other convIds than foldIds[i]
-            traintext = []
-            for k in range(0, i) + range(i+1, foldN):
-                text = get_sents_fromdict(alldata, foldIds[k], j)
-                traintext += text
-            # write traintext to file
-            trainfile = 'data/lm/train.txt'
-            with open(trainfile, 'w') as f:
-                for text in traintext:
-                    f.write(text + '\n')
-            # train the LM
-            lmfile = 'data/lm/train.lm'
-            srilm_dir = '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/'
-            train_cmd = [srilm_dir + 'ngram-count', '-order', '3', '-text', trainfile, '-lm', lmfile]
-            FNULL = open(os.devnull, 'w') # suppress stdout and stderr
-            return_code = subprocess.check_call(train_cmd, stdout=FNULL, stderr=subprocess.STDOUT)
-            if return_code != 0:
-                raise Exception('trainning failed for fold %s at sentence position %s' % (i, j))
-            # compute perplexity and oovn
-            testtext = get_sents_fromdict(alldata, foldIds[i], j)
-            testfile = 'data/lm/test.txt'
-            with open(testfile, 'w') as f:
-                for text in testtext:
-                    f.write(text + '\n')
-            lm = initLM(3)
-            readLM(lm, lmfile)
-            ppl = getCorpusPpl(lm, testfile)
-            oovn = model_oov(lm_file=lmfile, test_file=testfile)
-            results.append((i, j, ppl, oovn))
-            # print process within a fold
-            sys.stdout.write('\rfold %s, %s/%s sentences done' % (i, j, sent_n))
-            sys.stdout.flush()
-        print('fold %s done' % i)
+    # cross-validation, for each fold and then each sentence position
+    units = [unit_name(i, j) for i in range(0, foldN) for j in range(1, sent_n+1)]
+    if workers > 1:
+        # each worker starts at a different unit, and takes the units no other worker has claimed
+        starts = [len(units) * k // workers for k in range(0, workers)]
+        pool = Pool(processes=workers)
+        try:
+            worker_results = pool.map(_samepos_ppl_worker,
+                [(input_file, sent_n, store.store_dir, units[s:] + units[:s]) for s in starts])
+        finally:
+            pool.close()
+            pool.join()
+        for hits, misses, stages in worker_results:
+            default_cache().hits += hits
+            default_cache().misses += misses
+            default_stats().merge(stages)
+    # run the units left, and wait for those held by other runs
+    run_units(store, units, lambda unit: samepos_ppl_unit(job, unit))
+    print('\nDone for %s' % input_file)
 
     # write results to outputfile
-    with open(output_file, 'w') as f:
-        csvwriter = csv.writer(f, delimiter=',')
-        csvwriter.writerow(['foldId', 'sentenceId', 'ppl', 'oovn'])
-        for row in results:
-            csvwriter.writerow(row)
+    with default_stats().stage('write'):
+        store.merge(units, output_file, ['foldId', 'sentenceId', 'ppl', 'oovn'])
 
 
 ##
@@ -223,3 +253,8 @@ if __name__ == '__main__':
     cv_samepos_ppl(input_file='data/BNC_text_dbfull_mlrcut.csv', output_file='data/lm/BNC_cv_samepos_ppl.txt')
     # Perplexity: mean = 84.92237, sd = 15.58643
     # OOVN: 55438
+
+    # how many of the LMs above were loaded from the cache rather than trained
+    default_cache().report()
+    # where the time went, if run with RUN_STATS=1
+    default_stats().report()
@@ -0,0 +1,1014 @@
+#!/usr/bin/python
+# In-process n-gram language models, trained straight from in-memory sentences
+# Replaces the `ngram-count` + `readLM` round trip in the cross-validation code
+# 10/18/2026
+
+from __future__ import print_function, division
+
+import os
+import sys
+import math
+import itertools
+import numpy as np
+
+
+SENT_START = '<s>'
+SENT_END = '</s>'
+SENT_UNK = '<unk>'
+START_ID = 0
+END_ID = 1
+
+LOGP_ZERO = float('-inf') # SRILM's LogP_Zero, i.e., what an OOV gets
+LOGP_NONEVENT = -99.0 # what SRILM writes as the unigram log-prob of <s>
+PROB_EPSILON = 3e-06 # SRILM's Prob_Epsilon
+
+
+##
+# the default -gtNmin and -gtNmax of `ngram-count`
+def default_mincount(n):
+    return 1 if n <= 2 else 2
+
+def default_maxcount(n):
+    return 1 if n == 1 else 7
+
+
+##
+# str <-> bytes, for both Python 2 (where str is bytes) and Python 3
+def _to_bytes(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+def _from_bytes(data):
+    return data if isinstance(data, str) else data.decode('utf-8')
+
+
+##
+# word <-> integer id mapping
+class Vocab(object):
+    """
+    id 0 is always <s> and id 1 is always </s>
+    """
+    def __init__(self, words=()):
+        self.words = []
+        self.index = {}
+        for w in (SENT_START, SENT_END) + tuple(words):
+            self.add(w)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def add(self, word):
+        i = self.index.get(word)
+        if i is None:
+            i = len(self.words)
+            self.index[word] = i
+            self.words.append(word)
+        return i
+
+    def lookup(self, words):
+        """
+        return: int64 array of the ids of words, -1 for those not in the vocab
+        """
+        return np.array([self.index.get(w, -1) for w in words], dtype=np.int64)
+
+    def encode(self, sentences, grow=False, skip_empty=False):
+        """
+        sentences: an iterable of str
+        grow: add unseen words to the vocab; otherwise they are encoded as -1
+        return: (ids, offsets), the int32 ids of all words, and the int64 offsets
+            of each sentence into ids (len(offsets) == number of sentences + 1)
+        """
+        tokens = []
+        offsets = [0]
+        for text in sentences:
+            words = text.split()
+            if skip_empty and len(words) == 0:
+                continue
+            tokens.extend(words)
+            offsets.append(len(tokens))
+        ids = [self.add(w) for w in tokens] if grow else self.lookup(tokens)
+        return np.array(ids, dtype=np.int32), np.array(offsets, dtype=np.int64)
+
+
+##
+# A read-only Vocab over the arrays written by write_vocab, usually memory-mapped: the words by id,
+# utf-8 encoded in a fixed-width bytes array, and the ids in the sorted order of their words.
+# Words are looked up by binary search, so no word -> id dict is built when a vocab is loaded
+class ArrayVocab(Vocab):
+    def __init__(self, word_bytes, sorted_ids):
+        self.word_bytes = word_bytes
+        self.sorted_ids = sorted_ids
+        self.words = _ArrayWords(word_bytes)
+
+    def __len__(self):
+        return len(self.word_bytes)
+
+    def __contains__(self, word):
+        return self.lookup([word])[0] >= 0
+
+    def add(self, word):
+        i = self.lookup([word])[0]
+        if i < 0:
+            raise ValueError('cannot add %r to a read-only vocab' % word)
+        return i
+
+    def lookup(self, words):
+        keys = np.array([_to_bytes(w) for w in words], dtype=bytes)
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # keys longer than the array's width are truncated for the search, and fail the comparison below
+        pos = np.searchsorted(self.word_bytes, keys.astype(self.word_bytes.dtype), sorter=self.sorted_ids)
+        ids = np.asarray(self.sorted_ids[np.minimum(pos, len(self) - 1)], dtype=np.int64)
+        return np.where(self.word_bytes[ids] == keys, ids, -1)
+
+# the words of an ArrayVocab by id, decoded when accessed
+class _ArrayWords(object):
+    def __init__(self, word_bytes):
+        self.word_bytes = word_bytes
+
+    def __len__(self):
+        return len(self.word_bytes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [_from_bytes(w) for w in self.word_bytes[i]]
+        return _from_bytes(self.word_bytes[i])
+
+    def __iter__(self):
+        for w in self.word_bytes:
+            yield _from_bytes(w)
+
+##
+# write a vocab into dirpath: vocab.txt, one utf-8 encoded word per line,
+# and the vocab.npy and vocab_order.npy arrays of ArrayVocab
+def write_vocab(vocab, dirpath):
+    word_bytes = np.array([_to_bytes(w) for w in vocab.words], dtype=bytes)
+    with open(os.path.join(dirpath, 'vocab.txt'), 'wb') as fw:
+        for w in word_bytes:
+            fw.write(w + b'\n')
+    np.save(os.path.join(dirpath, 'vocab.npy'), word_bytes)
+    np.save(os.path.join(dirpath, 'vocab_order.npy'), np.argsort(word_bytes, kind='mergesort').astype(np.int64))
+
+##
+# load the vocab written by write_vocab as an ArrayVocab, or from vocab.txt alone for the directories written before
+def load_vocab(dirpath, mmap_mode='r'):
+    if os.path.exists(os.path.join(dirpath, 'vocab_order.npy')):
+        return ArrayVocab(np.load(os.path.join(dirpath, 'vocab.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(dirpath, 'vocab_order.npy'), mmap_mode=mmap_mode))
+    with open(os.path.join(dirpath, 'vocab.txt'), 'rb') as fr:
+        return Vocab([_from_bytes(line.rstrip(b'\n')) for line in fr][2:])
+
+
+##
+# surround each sentence with <s> and </s>
+def pad_sentences(ids, offsets):
+    """
+    return: (seq, padded_offsets), both int64
+    """
+    nsent = len(offsets) - 1
+    padded_offsets = offsets + 2 * np.arange(nsent + 1, dtype=np.int64)
+    seq = np.empty(len(ids) + 2 * nsent, dtype=np.int64)
+    inner = np.ones(len(seq), dtype=bool)
+    inner[padded_offsets[:-1]] = False
+    inner[padded_offsets[1:] - 1] = False
+    seq[padded_offsets[:-1]] = START_ID
+    seq[padded_offsets[1:] - 1] = END_ID
+    seq[inner] = ids
+    return seq, padded_offsets
+
+
+##
+# n-gram tables are kept as tries in sorted arrays: an n-gram of order n > 1 is stored under the key
+# parent * V + wn, where parent is the word id w1 for bigrams, and for higher orders the position of
+# its prefix w1..wn-1 in the order n-1 table. Keys sort the n-grams of every order lexicographically,
+# so the n-grams that share a context are contiguous, and stay well within int64 for any order
+def trie_search(table, keys):
+    """
+    return: the positions of keys in the sorted array table, -1 where absent
+    """
+    if len(table) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(table, keys), len(table) - 1)
+    return np.where((table[pos] == keys) & (keys >= 0), pos, -1)
+
+def trie_child(table, parent, words, vocab_size):
+    """
+    parent: the nodes of the prefixes, -1 for absent ones
+    return: the nodes (positions in table) of the n-grams that extend them with words, -1 where absent
+    """
+    return trie_search(table, np.where(parent >= 0, parent * vocab_size + words, -1))
+
+def trie_nodes(keys, grams, vocab_size):
+    """
+    keys: the trie keys by order, as in count_ngrams or NgramLM
+    grams: int array (N, n), the word ids of n-grams
+    return: their nodes at order n, -1 where absent; for n == 1 the word ids themselves
+    """
+    node = np.asarray(grams[:, 0], dtype=np.int64)
+    for j in range(1, grams.shape[1]):
+        node = trie_child(keys[j+1], node, grams[:, j], vocab_size)
+    return node
+
+def trie_grams(keys, vocab_size):
+    """
+    keys: the trie keys of a count table, by order
+    return: a list indexed by order (index 0 unused) of int64 arrays (N, n), the word ids of its n-grams
+    """
+    grams = [None, np.asarray(keys[1], dtype=np.int64).reshape(-1, 1)]
+    for n in range(2, len(keys)):
+        parent, words = keys[n] // vocab_size, keys[n] % vocab_size
+        prefix = parent.reshape(-1, 1) if n == 2 else grams[n-1][parent]
+        grams.append(np.column_stack([prefix, words]))
+    return grams
+
+##
+# convert the packed keys (w1*V^(n-1) + ... + wn) of models saved before the trie layout
+def trie_from_packed(packed, vocab_size):
+    keys = list(packed)
+    for n in range(3, len(packed)):
+        parent = np.searchsorted(packed[n-1], packed[n] // vocab_size)
+        keys[n] = parent * vocab_size + packed[n] % vocab_size
+    return keys
+
+
+##
+# count all n-grams up to order in the <s>/</s> padded sentences
+def count_ngrams(ids, offsets, vocab_size, order=3):
+    """
+    empty sentences are skipped
+    return: (keys, counts), two lists indexed by n-gram order (index 0 unused)
+        keys[1] holds the sorted word ids, keys[n] the sorted trie keys of the n-grams, and counts[n] their frequencies
+    """
+    offsets = np.unique(offsets)
+    seq, padded_offsets = pad_sentences(ids, offsets)
+    if float(len(seq)) * vocab_size >= 2**63:
+        raise ValueError('corpus of %s tokens is too large for %s-word trie keys' % (len(seq), vocab_size))
+    sent = np.repeat(np.arange(len(padded_offsets) - 1), np.diff(padded_offsets))
+    k, c = np.unique(seq, return_counts=True)
+    keys, counts = [None, k], [None, c.astype(np.int64)]
+    # the node of the n-gram that starts at each position of seq
+    node = seq
+    for n in range(2, order+1):
+        m = max(len(seq) - n + 1, 0)
+        starts = np.nonzero(sent[:m] == sent[n-1:n-1+m])[0]
+        k, index, c = np.unique(node[starts] * vocab_size + seq[starts + n-1], return_inverse=True, return_counts=True)
+        node = np.full(len(seq), -1, dtype=np.int64)
+        node[starts] = index
+        keys.append(k)
+        counts.append(c.astype(np.int64))
+    return keys, counts
+
+##
+# sum several count tables returned by count_ngrams over the same vocab
+def merge_counts(tables, vocab_size):
+    """
+    tables: a list of (keys, counts)
+    return: (keys, counts)
+    """
+    order = len(tables[0][0]) - 1
+    keys, counts = [None], [None]
+    # the position of each entry of each table in the merged table of the previous order
+    moved = [None] * len(tables)
+    for n in range(1, order+1):
+        tkeys = []
+        for t, table in enumerate(tables):
+            k = table[0][n]
+            if n > 2:
+                k = moved[t][k // vocab_size] * vocab_size + k % vocab_size
+            tkeys.append(k)
+        k, index = np.unique(np.concatenate(tkeys), return_inverse=True)
+        c = np.bincount(index, weights=np.concatenate([t[1][n] for t in tables]), minlength=len(k))
+        moved = np.split(index, np.cumsum([len(tk) for tk in tkeys])[:-1])
+        keys.append(k)
+        counts.append(np.rint(c).astype(np.int64))
+    return keys, counts
+
+##
+# take the counts of part (a table merged into total) back out of total
+def subtract_counts(total, part, vocab_size):
+    """
+    return: (keys, counts), without the n-grams whose count drops to zero
+    """
+    order = len(total[0]) - 1
+    keys, counts = [None], [None]
+    for n in range(1, order+1):
+        k, pk = total[0][n], part[0][n]
+        if n > 2:
+            # renumber the parents, as to where part's sit in total, and as to what is left of total
+            pk = pos[pk // vocab_size] * vocab_size + pk % vocab_size
+            k = left[k // vocab_size] * vocab_size + k % vocab_size
+        pos = np.searchsorted(total[0][n], pk)
+        c = total[1][n].copy()
+        c[pos] -= part[1][n]
+        # an n-gram is never left with more counts than its prefix, so none is left without one
+        kept = c > 0
+        left = np.cumsum(kept) - 1
+        keys.append(k[kept])
+        counts.append(c[kept])
+    return keys, counts
+
+
+##
+# Good-Turing discount coefficients, as in SRILM's GoodTuring::estimate
+def good_turing_coeffs(counts, maxcount):
+    """
+    return: (coeffs, maxcount), the coefficients of counts 0..maxcount, and maxcount as lowered by SRILM:
+        to 0 (no discounting) when there are no singletons, and else until the count-of-count of maxcount+1 is not zero
+    """
+    n = np.bincount(counts, minlength=maxcount + 2).astype(float)
+    if n[1] == 0:
+        maxcount = 0
+    while maxcount > 0 and n[maxcount + 1] == 0:
+        maxcount -= 1
+    coeffs = np.ones(maxcount + 1)
+    if maxcount <= 0:
+        return coeffs, maxcount
+    common = (maxcount + 1) * n[maxcount + 1] / n[1]
+    for r in range(1, maxcount + 1):
+        if n[r] == 0 or common == 1.0:
+            continue
+        coeff0 = (r + 1) * n[r + 1] / (r * n[r])
+        coeff = (coeff0 - common) / (1.0 - common)
+        if math.isinf(coeff) or math.isnan(coeff) or coeff <= PROB_EPSILON or coeff0 > 1.0:
+            coeff = 1.0
+        coeffs[r] = coeff
+    return coeffs, maxcount
+
+##
+# the D1, D2 and D3+ of modified Kneser-Ney, as in SRILM's ModKneserNey::estimate
+def kneser_ney_discounts(counts):
+    n = np.bincount(counts, minlength=5).astype(float)
+    if n[1] == 0 or n[2] == 0 or n[3] == 0 or n[4] == 0:
+        raise ValueError('one of the modified Kneser-Ney count-of-counts is zero')
+    y = n[1] / (n[1] + 2 * n[2])
+    return np.array([0.0, 1 - 2 * y * n[2] / n[1], 2 - 3 * y * n[3] / n[2], 3 - 4 * y * n[4] / n[3]])
+
+##
+# the multiplicative discount applied to each count
+def discount_factors(counts, method, mincount, maxcount):
+    if method == 'gt':
+        coeffs, maxcount = good_turing_coeffs(counts, maxcount)
+        disc = np.ones(len(counts))
+        small = counts <= maxcount
+        disc[small] = coeffs[counts[small]]
+    elif method == 'kn':
+        d = kneser_ney_discounts(counts)
+        disc = (counts - d[np.minimum(counts, 3)]) / counts.astype(float)
+    else:
+        raise ValueError('unknown discounting method: %s' % method)
+    disc[counts < mincount] = 0.0
+    return disc
+
+
+##
+# Modified Kneser-Ney replaces the counts of lower orders with the number of distinct
+# left contexts, except for the n-grams that start with <s>
+def continuation_counts(keys, counts, vocab_size):
+    grams = trie_grams(keys, vocab_size)
+    new_counts = [None]
+    for n in range(1, len(keys) - 1):
+        # each distinct (n+1)-gram is one left context of its suffix
+        suffix, ncontexts = np.unique(trie_nodes(keys, grams[n+1][:, 1:], vocab_size), return_counts=True)
+        c = counts[n].copy()
+        c[suffix if n > 1 else np.searchsorted(keys[1], suffix)] = ncontexts
+        starts_with_bos = grams[n][:, 0] == START_ID
+        c[starts_with_bos] = counts[n][starts_with_bos]
+        new_counts.append(c)
+    new_counts.append(counts[-1])
+    return new_counts
+
+
+##
+# A backoff n-gram LM held in sorted arrays
+class NgramLM(object):
+    """
+    Unigram log-probs and backoff weights are dense arrays indexed by word id;
+    the n-grams of order n > 1 are stored under their trie keys (see trie_search) in keys[n],
+    and their log-probs and backoff weights at the same positions.
+    All probabilities are log10, as in ARPA files.
+    """
+    def __init__(self, vocab, order, keys, logprobs, bows):
+        self.vocab = vocab
+        self.order = order
+        self.keys = keys
+        self.logprobs = logprobs
+        self.bows = bows
+
+    def _find(self, n, keys):
+        """
+        return: the positions of keys in the order-n table, -1 where absent
+        """
+        return trie_search(self.keys[n], keys)
+
+    @staticmethod
+    def _take(values, pos, default):
+        if len(values) == 0:
+            return np.full(len(pos), default)
+        return np.where(pos >= 0, values[np.maximum(pos, 0)], default)
+
+    def logprob_ids(self, hist, words, order=None, return_orders=False):
+        """
+        hist: int array (N, m), the context word ids with the most recent one last;
+            negative ids (OOVs, or positions before <s>) end the usable context
+        words: int array (N,), the predicted word ids, -1 for OOVs
+        order: the highest order used, at most the model's
+        return: float64 array (N,) of Katz backoff log10 probabilities
+            and, if return_orders, an int8 array (N,) of the order of the n-gram each was found at
+            after backing off, 0 for OOVs
+        """
+        order = self.order if order is None else min(order, self.order)
+        V = len(self.vocab)
+        words = np.asarray(words, dtype=np.int64)
+        hist = np.asarray(hist, dtype=np.int64)
+        known = words >= 0
+        lp = np.full(len(words), LOGP_ZERO)
+        lp[known] = self.logprobs[1][words[known]]
+        ok = known.copy()
+        if return_orders:
+            orders = np.isfinite(lp).astype(np.int8)
+        for n in range(2, min(order, hist.shape[1] + 1) + 1):
+            ok &= hist[:, -(n-1)] >= 0
+            if not ok.any():
+                break
+            # walk down the trie from the oldest context word to the node of the context
+            ctx = np.where(ok, hist[:, -(n-1)], 0)
+            for j in range(n-2, 0, -1):
+                ctx = trie_child(self.keys[n-j], ctx, hist[:, -j], V)
+            if n == 2:
+                bow = self.bows[1][ctx]
+            else:
+                bow = self._take(self.bows[n-1], ctx, 0.0)
+            pos = trie_child(self.keys[n], ctx, np.where(known, words, 0), V)
+            hit = ok & (pos >= 0)
+            lp = np.where(hit, self._take(self.logprobs[n], pos, 0.0), np.where(ok, lp + bow, lp))
+            if return_orders:
+                orders[hit] = n
+        if return_orders:
+            return lp, orders
+        return lp
+
+    def encode(self, sentences, unk=False):
+        """
+        unk: map the words not in the vocab to <unk>, if the model has it, as `ngram -unk` does
+        return: (ids, offsets) as in Vocab.encode; words not in the vocab are OOVs (-1) unless mapped to <unk>
+        """
+        ids, offsets = self.vocab.encode(sentences)
+        unk_id = self.vocab.lookup([SENT_UNK])[0] if unk else -1
+        if unk_id >= 0:
+            ids[ids < 0] = unk_id
+        return ids, offsets
+
+    def ngram_prob(self, gram):
+        """
+        gram: str or sequence of words, the last of which is predicted
+        return: log10 P(last word | preceding words), like getNgramProb
+        """
+        words = gram.split() if isinstance(gram, str) else list(gram)
+        ids, _ = self.encode([' '.join(words)])
+        return float(self.logprob_ids(ids[:-1].reshape(1, -1), ids[-1:])[0])
+
+    def unigram_prob(self, word):
+        return self.ngram_prob([word])
+
+    def sentence_logprob(self, words):
+        """
+        Score words plus </s> given <s>, as SRILM does for a sentence
+        return: (total log10 prob of in-vocab words, number of words, number of OOVs)
+        """
+        logprobs, offsets = score_sentences(self, [' '.join(words)])
+        oov = np.isneginf(logprobs)
+        return float(logprobs[~oov].sum()), len(words), int(oov.sum())
+
+    def sentence_ppl(self, words):
+        """
+        return: the sentence perplexity, like getSentencePpl
+        """
+        logprob, nwords, noov = self.sentence_logprob(words)
+        return 10 ** (-logprob / (nwords - noov + 1))
+
+
+##
+# the context and the word id of each token predicted in scoring sentences: the words of each sentence and </s>
+def _predicted_tokens(lm, sentences, order=None, unk=False):
+    """
+    return: (hist, words, offsets), as taken by NgramLM.logprob_ids, and the offsets of each sentence's tokens
+    """
+    if isinstance(sentences, tuple):
+        ids, offsets = sentences
+    else:
+        ids, offsets = lm.encode(sentences, unk)
+    seq, padded_offsets = pad_sentences(ids, offsets)
+    nsent = len(offsets) - 1
+    # every position but the leading <s> of each sentence is predicted
+    predicted = np.ones(len(seq), dtype=bool)
+    predicted[padded_offsets[:-1]] = False
+    pos = np.nonzero(predicted)[0]
+    sent_start = np.repeat(padded_offsets[:-1], np.diff(padded_offsets))[pos]
+    m = (lm.order if order is None else min(order, lm.order)) - 1
+    hist = np.full((len(pos), m), -2, dtype=np.int64)
+    for j in range(1, m+1):
+        inside = pos - j >= sent_start
+        hist[inside, m-j] = seq[pos[inside] - j]
+    return hist, seq[pos], padded_offsets - np.arange(nsent + 1, dtype=np.int64)
+
+##
+# score a whole batch of sentences in one vectorized pass
+def score_sentences(lm, sentences, order=None, unk=False):
+    """
+    lm: NgramLM
+    sentences: a list of str, or an (ids, offsets) pair already encoded with lm.encode
+    order: the highest n-gram order used, defaults to the model's
+    unk: score the words not in the vocab as <unk>, see NgramLM.encode
+    return: (logprobs, offsets); logprobs[offsets[i]:offsets[i+1]] are the log10 probs of
+        the words of sentence i followed by </s>, each given <s> and the preceding words.
+        OOVs get LOGP_ZERO.
+    """
+    hist, words, offsets = _predicted_tokens(lm, sentences, order, unk)
+    return lm.logprob_ids(hist, words), offsets
+
+##
+# score_sentences, keeping what is known of each token
+def score_tokens(lm, sentences, order=None, unk=False):
+    """
+    return: (ids, logprobs, orders, offsets); ids are the word ids of the tokens in lm.vocab
+        (-1 for words not in it, and END_ID for </s>), and orders those of the n-grams their
+        probs were found at, 0 for OOVs. The rest is as in score_sentences.
+    """
+    hist, words, offsets = _predicted_tokens(lm, sentences, order, unk)
+    logprobs, orders = lm.logprob_ids(hist, words, return_orders=True)
+    return words.astype(np.int32), logprobs, orders, offsets
+
+
+##
+# per-sentence measures derived from the output of score_sentences
+def _sentence_index(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def oovs_from_scores(logprobs, offsets):
+    """
+    return: int array, the number of OOVs in each sentence
+    """
+    return np.bincount(_sentence_index(offsets), weights=np.isneginf(logprobs),
+        minlength=len(offsets) - 1).astype(np.int64)
+
+def entropy_from_scores(logprobs, offsets, skip_first=True):
+    """
+    return: float array, the mean negative log10 prob of each sentence, inf if it has an OOV
+        skip_first leaves out the first word, as the padded trigrams in sentence_entropy do
+    """
+    sid = _sentence_index(offsets)
+    scored = np.ones(len(logprobs), dtype=bool)
+    if skip_first:
+        scored[offsets[:-1][np.diff(offsets) > 0]] = False
+    oov = np.isneginf(logprobs)
+    nsent = len(offsets) - 1
+    total = np.bincount(sid[scored & ~oov], weights=-logprobs[scored & ~oov], minlength=nsent)
+    n = np.bincount(sid[scored], minlength=nsent)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ent = total / n
+    ent[np.bincount(sid[scored & oov], minlength=nsent) > 0] = np.inf
+    return ent
+
+def ppl_from_scores(logprobs, offsets):
+    """
+    return: float array, the perplexity of each sentence, like getSentencePpl
+        (OOVs are left out of both the log prob and the token count)
+    """
+    sid = _sentence_index(offsets)
+    oov = np.isneginf(logprobs)
+    nsent = len(offsets) - 1
+    total = np.bincount(sid[~oov], weights=logprobs[~oov], minlength=nsent)
+    n = np.bincount(sid[~oov], minlength=nsent)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10 ** (-total / n)
+
+
+##
+# the mean entropy of the sentences of each length, summed up as they are scored, to normalize the entropy
+# of a sentence by that of the sentences of its length: ent_norm = ent / ent_mean, as in norm_information.R
+class LengthMeans(object):
+    """
+    sums, counts: the total entropy and the number of sentences, indexed by sentence length in words
+    Only finite entropies are summed up, so that the sentences with OOVs (inf) do not make the means of
+    their lengths inf
+    """
+    def __init__(self):
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, ents, lengths):
+        """
+        ents, lengths: the entropies of sentences and their numbers of words
+        """
+        ents = np.asarray(ents, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        finite = np.isfinite(ents)
+        size = max(len(self.counts), int(lengths.max()) + 1 if len(lengths) else 0)
+        sums = np.bincount(lengths[finite], weights=ents[finite], minlength=size)
+        counts = np.bincount(lengths[finite], minlength=size).astype(np.int64)
+        sums[:len(self.sums)] += self.sums
+        counts[:len(self.counts)] += self.counts
+        self.sums, self.counts = sums, counts
+
+    def means(self):
+        """
+        return: float array, the mean entropy by length, NaN for the lengths with no sentence
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.sums / self.counts
+
+    def normalize(self, ents, lengths):
+        """
+        return: float array, each of ents divided by the mean entropy of its length
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        means = np.full(len(lengths), np.nan)
+        inside = lengths < len(self.counts)
+        means[inside] = self.means()[lengths[inside]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.asarray(ents, dtype=np.float64) / means
+
+
+##
+# corpus-level counts of a test set, the counterpart of SRILM's TextStats as filled by corpusStats
+class TextStats(object):
+    """
+    prob: the total log10 prob of the in-vocab words and </s>
+    numSentences, numWords, numOOVs, zeroProbs: as in `ngram -ppl`; OOVs are included in numWords
+    """
+    def __init__(self):
+        self.prob = 0.0
+        self.numSentences = 0
+        self.numWords = 0
+        self.numOOVs = 0
+        self.zeroProbs = 0
+
+    def add(self, logprobs, offsets):
+        """
+        add the output of score_sentences
+        """
+        oov = np.isneginf(logprobs)
+        nsent = len(offsets) - 1
+        self.prob += float(logprobs[~oov].sum())
+        self.numSentences += nsent
+        self.numWords += len(logprobs) - nsent
+        self.numOOVs += int(oov.sum())
+
+    def ppl(self):
+        return 10 ** (-self.prob / (self.numWords - self.numOOVs - self.zeroProbs + self.numSentences))
+
+    def ppl1(self):
+        """
+        the perplexity without </s>
+        """
+        return 10 ** (-self.prob / (self.numWords - self.numOOVs - self.zeroProbs))
+
+##
+# score a test set in one streaming pass, chunk by chunk, and return its TextStats
+def corpus_stats(lm, sentences, chunksize=100000, unk=False):
+    """
+    sentences: an iterable of str; empty ones are skipped, as `ngram -ppl` does
+    unk: count the words not in the vocab as <unk> rather than as OOVs, as `ngram -ppl -unk` does
+    """
+    stats = TextStats()
+    sentences = (text for text in sentences if text.strip() != '')
+    while True:
+        chunk = list(itertools.islice(sentences, chunksize))
+        if not chunk:
+            break
+        stats.add(*score_sentences(lm, chunk, unk=unk))
+    return stats
+
+##
+# corpus_stats of a text file with one sentence per line, the in-process counterpart of corpusStats
+def file_stats(lm, filename, chunksize=100000, unk=False):
+    with open(filename, 'r') as fr:
+        return corpus_stats(lm, (line.strip() for line in fr), chunksize, unk)
+
+
+##
+# the relative frequencies of the words of a training corpus, counted chunk by chunk,
+# and kept as a -log p array indexed by the word ids of its vocab
+class UnigramTable(object):
+    """
+    vocab: Vocab of the training words
+    counts: int64 array of word counts by id; <s> and </s> are never counted
+    """
+    def __init__(self):
+        self.vocab = Vocab()
+        self.counts = np.zeros(len(self.vocab), dtype=np.int64)
+        self._neglogprobs = None
+
+    def add(self, sentences):
+        """
+        count the words of sentences, an iterable of str
+        """
+        ids, _ = self.vocab.encode(sentences, grow=True)
+        counts = np.bincount(ids, minlength=len(self.vocab))
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+        self._neglogprobs = None
+
+    def neglogprobs(self):
+        """
+        return: float64 array, -log(count / N) by word id, and NaN for the ids never counted
+        """
+        if self._neglogprobs is None:
+            seen = self.counts > 0
+            self._neglogprobs = np.full(len(self.counts), np.nan)
+            self._neglogprobs[seen] = -np.log(self.counts[seen] / float(self.counts.sum()))
+        return self._neglogprobs
+
+    def score_invocab(self, sentences):
+        """
+        sentences: a list of str
+        return: (ents, invocab), float arrays of the mean -log p of the in-vocab words of each sentence
+            (NaN if it has none), and the proportion of its words that are in vocab (0 for empty sentences)
+        """
+        ids, offsets = self.vocab.encode(sentences)
+        values = np.where(ids >= 0, self.neglogprobs()[ids], np.nan)
+        invocab = ~np.isnan(values)
+        sid = _sentence_index(offsets)
+        nsent = len(offsets) - 1
+        sums = np.bincount(sid[invocab], weights=values[invocab], minlength=nsent)
+        counts = np.bincount(sid[invocab], minlength=nsent).astype(np.float64)
+        lengths = np.diff(offsets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ents = np.where(counts > 0, sums / counts, np.nan)
+            props = np.where(lengths > 0, counts / lengths, 0.0)
+        return ents, props
+
+
+##
+# read an ARPA file into an NgramLM
+def read_arpa(lmfile):
+    """
+    The in-process counterpart of initLM + readLM
+    """
+    vocab = Vocab()
+    unigrams = {}
+    keys, logprobs, bows = {}, {}, {}
+    order = 0
+    section = None
+    with open(lmfile, 'r') as fr:
+        for line in fr:
+            line = line.strip()
+            if line == '' or line.startswith('ngram '):
+                continue
+            if line == '\\data\\':
+                section = 0
+                continue
+            if line == '\\end\\':
+                break
+            if line.startswith('\\') and line.endswith('-grams:'):
+                section = int(line[1:line.index('-')])
+                order = max(order, section)
+                keys[section], logprobs[section], bows[section] = [], [], []
+                continue
+            if not section:
+                continue
+            items = line.split()
+            bow = float(items[section+1]) if len(items) > section + 1 else 0.0
+            if section == 1:
+                unigrams[vocab.add(items[1])] = (float(items[0]), bow)
+            else:
+                keys[section].extend(vocab.index[w] for w in items[1:section+1])
+                logprobs[section].append(float(items[0]))
+                bows[section].append(bow)
+    V = len(vocab)
+
+    lm = NgramLM(vocab, order, [None] * (order+1), [None] * (order+1), [None] * (order+1))
+    lm.logprobs[1] = np.full(V, LOGP_ZERO, dtype=np.float32)
+    lm.bows[1] = np.zeros(V, dtype=np.float32)
+    for i, (lp, bow) in unigrams.items():
+        lm.logprobs[1][i] = lp
+        lm.bows[1][i] = bow
+    for n in range(2, order+1):
+        grams = np.array(keys[n], dtype=np.int64).reshape(-1, n)
+        # the prefix of every n-gram is an (n-1)-gram of the file, which holds its backoff weight
+        parent = trie_nodes(lm.keys, grams[:, :-1], V)
+        if (parent < 0).any():
+            raise ValueError('%s has %s-grams whose prefix is not listed' % (lmfile, n))
+        k = parent * V + grams[:, -1]
+        idx = np.argsort(k, kind='mergesort')
+        lm.keys[n] = k[idx]
+        lm.logprobs[n] = np.array(logprobs[n], dtype=np.float32)[idx]
+        lm.bows[n] = np.array(bows[n], dtype=np.float32)[idx]
+    return lm
+
+
+##
+# the arrays that make up an NgramLM, as saved by save_lm and write_lm_dir
+def _lm_arrays(lm):
+    arrays = {'order': np.array(lm.order), 'trie': np.array(1), 'logprobs1': lm.logprobs[1], 'bows1': lm.bows[1]}
+    for n in range(2, lm.order+1):
+        arrays['keys%s' % n] = lm.keys[n]
+        arrays['logprobs%s' % n] = lm.logprobs[n]
+        arrays['bows%s' % n] = lm.bows[n]
+    return arrays
+
+def _lm_from_arrays(vocab, get, names):
+    """
+    get: name -> array
+    names: the names of the arrays saved
+    """
+    order = int(get('order'))
+    lm = NgramLM(vocab, order, [None] * (order+1), [None] * (order+1), [None] * (order+1))
+    lm.logprobs[1] = get('logprobs1')
+    lm.bows[1] = get('bows1')
+    for n in range(2, order+1):
+        lm.keys[n] = get('keys%s' % n)
+        lm.logprobs[n] = get('logprobs%s' % n)
+        lm.bows[n] = get('bows%s' % n)
+    if 'trie' not in names:
+        lm.keys = trie_from_packed(lm.keys, len(lm.vocab))
+    return lm
+
+
+##
+# save an NgramLM to a single .npz file, and load it back
+def save_lm(lm, path):
+    arrays = _lm_arrays(lm)
+    arrays['vocab'] = np.frombuffer(_to_bytes('\n'.join(lm.vocab.words)), dtype=np.uint8)
+    with open(path, 'wb') as fw:
+        np.savez(fw, **arrays)
+
+def load_lm(path):
+    with np.load(path) as data:
+        arrays = dict((name, data[name]) for name in data.files)
+    words = _from_bytes(arrays['vocab'].tobytes()).split('\n')
+    return _lm_from_arrays(Vocab(words[2:]), arrays.get, list(arrays))
+
+
+##
+# write an NgramLM to a directory of .npy files, and load it back with the arrays memory-mapped,
+# so that loading takes about constant time and processes scoring with the same model share its pages
+def write_lm_dir(lm, lmdir):
+    if not os.path.isdir(lmdir):
+        os.makedirs(lmdir)
+    write_vocab(lm.vocab, lmdir)
+    for name, values in _lm_arrays(lm).items():
+        np.save(os.path.join(lmdir, name + '.npy'), values)
+
+def is_lm_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'logprobs1.npy'))
+
+def load_lm_dir(lmdir, mmap_mode='r'):
+    names = [os.path.splitext(f)[0] for f in os.listdir(lmdir)]
+    return _lm_from_arrays(load_vocab(lmdir, mmap_mode), lambda name: np.load(os.path.join(lmdir, name + '.npy'), mmap_mode=mmap_mode), names)
+
+##
+# convert an ARPA file into the directory format of write_lm_dir
+def compile_arpa(lmfile, lmdir=None):
+    """
+    lmdir: defaults to lmfile with its extension replaced by `.lmdir`
+    return: lmdir
+    """
+    if lmdir is None:
+        lmdir = os.path.splitext(lmfile)[0] + '.lmdir'
+    write_lm_dir(read_arpa(lmfile), lmdir)
+    return lmdir
+
+##
+# load a model compiled by compile_arpa, saved by save_lm, or else read it as an ARPA file
+def load_model(path):
+    if is_lm_dir(path):
+        return load_lm_dir(path)
+    if path.endswith('.npz'):
+        return load_lm(path)
+    return read_arpa(path)
+
+
+##
+# estimate a backoff LM from n-gram counts
+def estimate_lm(vocab, keys, counts, discount='gt', mincounts=None, maxcounts=None):
+    """
+    vocab: a Vocab that covers all ids in keys
+    keys, counts: as returned by count_ngrams
+    discount: 'gt' (Good-Turing with Katz backoff, SRILM's default) or 'kn' (modified Kneser-Ney, -kndiscount)
+    mincounts, maxcounts: dicts {order: count} overriding the -gtNmin and -gtNmax defaults
+    return: NgramLM
+    """
+    order = len(keys) - 1
+    V = len(vocab)
+    mincounts = dict((n, (mincounts or {}).get(n, default_mincount(n))) for n in range(1, order+1))
+    maxcounts = dict((n, (maxcounts or {}).get(n, default_maxcount(n))) for n in range(1, order+1))
+    if discount == 'kn':
+        counts = continuation_counts(keys, counts, V)
+
+    lm = NgramLM(vocab, order, [None] * (order+1), [None] * (order+1), [None] * (order+1))
+
+    # unigrams: <s> is a non-event; left-over mass goes to the zero-prob words, or else to all words
+    c1 = np.zeros(V, dtype=np.int64)
+    c1[keys[1]] = counts[1]
+    event = c1 > 0
+    event[START_ID] = False
+    disc = np.zeros(V)
+    disc[event] = discount_factors(c1[event], discount, mincounts[1], maxcounts[1])
+    prob = disc * c1 / max(c1[event].sum(), 1)
+    leftover = 1.0 - prob.sum()
+    if leftover > PROB_EPSILON:
+        zero = event & (prob == 0)
+        target = zero if zero.any() else event
+        prob[target] += leftover / target.sum()
+    with np.errstate(divide='ignore'):
+        lp1 = np.log10(prob)
+    lp1[START_ID] = LOGP_NONEVENT
+    lm.keys[1] = None
+    lm.logprobs[1] = lp1.astype(np.float32)
+    lm.bows[1] = np.zeros(V, dtype=np.float32)
+
+    # the n-grams that go into the model: those left with a count after discounting, and,
+    # as SRILM's fixupProbs does, the contexts they need but whose own count fell below -gtNmin,
+    # which are added back further down with their backoff probability
+    discs, present = [None, None], [None, None]
+    for n in range(2, order+1):
+        discs.append(discount_factors(counts[n], discount, mincounts[n], maxcounts[n]))
+        present.append(discs[n] > 0)
+    for n in range(order, 2, -1):
+        present[n-1][keys[n][present[n]] // V] = True
+
+    # higher orders, one context (the first n-1 words) at a time
+    grams = trie_grams(keys, V)
+    for n in range(2, order+1):
+        k, c, g, disc = keys[n], counts[n], grams[n], discs[n]
+        # the node of each context in the model: the word id for bigrams, or else
+        # the position in the order n-1 table of the model of its entry in the count table
+        ctx = k // V if n == 2 else model_node[k // V]
+        model_node = np.where(present[n], np.cumsum(present[n]) - 1, -1)
+        if len(c) == 0:
+            lm.keys[n] = np.zeros(0, dtype=np.int64)
+            lm.logprobs[n] = np.zeros(0, dtype=np.float32)
+            lm.bows[n] = np.zeros(0, dtype=np.float32)
+            continue
+        # group by the context in the count table, as contexts left out of the model all have node -1
+        newctx = np.r_[True, k[1:] // V != k[:-1] // V]
+        starts = np.nonzero(newctx)[0]
+        group = np.cumsum(newctx) - 1
+        total = np.add.reduceat(c, starts).astype(float)
+        prob = disc * c / total[group]
+        mass = np.add.reduceat(prob, starts)
+        # when discounting leaves no mass for backoff, add one to the total count
+        full = 1.0 - mass < PROB_EPSILON
+        if full.any():
+            total[full] += 1
+            prob = disc * c / total[group]
+            mass = np.add.reduceat(prob, starts)
+
+        # backoff weight of each context: (1 - sum of its probs) / (1 - sum of the lower-order probs);
+        # a context left out of the model has no n-gram kept, and so a weight of 1 anyway
+        kept = disc > 0
+        lower = 10.0 ** lm.logprob_ids(g[kept][:, 1:-1], g[kept][:, -1], order=n-1)
+        numerator = np.maximum(1.0 - mass, 0.0)
+        denominator = 1.0 - np.bincount(group[kept], weights=lower, minlength=len(starts))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bow = np.where(denominator <= 0, 0.0, np.log10(numerator) - np.log10(denominator))
+        in_model = ctx[starts] >= 0
+        lm.bows[n-1][ctx[starts][in_model]] = bow[in_model]
+
+        lp = np.zeros(len(c))
+        lp[kept] = np.log10(prob[kept])
+        # the added contexts get the probability the model backs off to: bow(w1..wn-1) * p(wn | w2..wn-1),
+        # which leaves the backoff weight of their own context as it is
+        added = present[n] & ~kept
+        if added.any():
+            lp[added] = lm.bows[n-1][ctx[added]] + lm.logprob_ids(g[added][:, 1:-1], g[added][:, -1], order=n-1)
+        keep = present[n]
+        lm.keys[n] = ctx[keep] * V + g[keep][:, -1]
+        lm.logprobs[n] = lp[keep].astype(np.float32)
+        lm.bows[n] = np.zeros(int(keep.sum()), dtype=np.float32)
+    return lm
+
+
+##
+# train a backoff LM from in-memory sentences
+def train_lm(sentences, order=3, discount='gt', mincounts=None, maxcounts=None):
+    """
+    The in-process counterpart of `ngram-count -order 3 -text train.txt -lm train.lm`
+    sentences: an iterable of str, words separated by whitespace
+    return: NgramLM
+    """
+    vocab = Vocab()
+    ids, offsets = vocab.encode(sentences, grow=True, skip_empty=True)
+    return train_lm_ids(vocab, ids, offsets, order, discount, mincounts, maxcounts)
+
+##
+# train a backoff LM from sentences already encoded with vocab, e.g. those of a corpus_db.TextDB
+def train_lm_ids(vocab, ids, offsets, order=3, discount='gt', mincounts=None, maxcounts=None):
+    """
+    vocab may hold words that never occur in ids; they get no probability (OOVs) in the model
+    empty sentences are skipped
+    """
+    keys, counts = count_ngrams(ids, offsets, len(vocab), order)
+    return estimate_lm(vocab, keys, counts, discount, mincounts, maxcounts)
+
+
+##
+# main
+if __name__ == '__main__':
+    # compile the ARPA files given on the command line, e.g.,
+    # $ python ngram_lm.py data/lm/BNC_full_order3.lm data/lm/CSN_order3.lm data/lm/wsj_gt10_text.lm
+    for lmfile in sys.argv[1:]:
+        print('compiled %s to %s' % (lmfile, compile_arpa(lmfile)))
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# Per-stage wall/CPU timers and sentence/token counters, with a JSON report of a run
+# Enabled by setting the environment variable RUN_STATS=1; the report is written to RUN_STATS_FILE
+# 10/18/2026
+
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import time
+
+
+ENABLED = os.environ.get('RUN_STATS', '0') not in ('', '0')
+DEFAULT_REPORT_FILE = os.environ.get('RUN_STATS_FILE', 'run_stats.json')
+
+# the stages timed by the pipelines
+STAGES = ['read', 'train', 'load', 'score', 'segment', 'write']
+
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+
+class Stage(object):
+    """
+    The timer of one `with stats.stage(name):` block
+    """
+    def __init__(self, totals, sentences, tokens):
+        self.totals = totals
+        self.sentences = sentences
+        self.tokens = tokens
+
+    def count(self, sentences=0, tokens=0):
+        self.sentences += sentences
+        self.tokens += tokens
+
+    def count_scores(self, logprobs, offsets):
+        # the sentences and words scored by ngram_lm.score_sentences, not counting </s>
+        self.count(len(offsets) - 1, len(logprobs) - len(offsets) + 1)
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = _cpu_time()
+        return self
+
+    def __exit__(self, *exc):
+        totals = self.totals
+        totals['calls'] += 1
+        totals['wall'] += time.time() - self.wall
+        totals['cpu'] += _cpu_time() - self.cpu
+        totals['sentences'] += self.sentences
+        totals['tokens'] += self.tokens
+        return False
+
+
+class NullStage(object):
+    """
+    What stage returns when stats are disabled, so that timed blocks cost next to nothing
+    """
+    def count(self, sentences=0, tokens=0):
+        pass
+
+    def count_scores(self, logprobs, offsets):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = NullStage()
+
+
+class RunStats(object):
+    """
+    enabled: if False, stage returns a shared no-op timer and nothing is recorded
+    """
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.started = time.time()
+        self.stages = {}
+
+    def stage(self, name, sentences=0, tokens=0):
+        """
+        name: one of STAGES, or any other label
+        sentences, tokens: the amount of text the block processes; more can be added with Stage.count
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'sentences': 0, 'tokens': 0}
+        return Stage(self.stages[name], sentences, tokens)
+
+    def timed(self, name, iterable, sentences=None):
+        """
+        iterable: timed as each of its items is produced, e.g., the chunks of corpus_db.read_csv_chunks
+        sentences: a function that returns the number of sentences in an item
+        return: an iterable of the same items
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed(name, iterable, sentences)
+
+    def _timed(self, name, iterable, sentences):
+        it = iter(iterable)
+        while True:
+            with self.stage(name) as timer:
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                if sentences is not None:
+                    timer.count(sentences(item))
+            yield item
+
+    def take(self):
+        """
+        return: the stage totals recorded so far, which are cleared, e.g., to send them from a worker process
+        """
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def merge(self, stages):
+        """
+        stages: the totals returned by take in another process; their times add up over processes
+        """
+        for name, totals in stages.items():
+            if name not in self.stages:
+                self.stages[name] = dict(totals)
+            else:
+                for k, v in totals.items():
+                    self.stages[name][k] += v
+
+    def summary(self):
+        """
+        return: a dict of the stage totals with sentences/sec and tokens/sec, ready to be dumped as JSON
+        """
+        stages = {}
+        for name, totals in self.stages.items():
+            s = dict(totals)
+            s['sentences_per_sec'] = s['sentences'] / s['wall'] if s['wall'] > 0 else None
+            s['tokens_per_sec'] = s['tokens'] / s['wall'] if s['wall'] > 0 else None
+            stages[name] = s
+        return {'run': ' '.join(sys.argv), 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall': time.time() - self.started, 'stages': stages}
+
+    def report(self, path=DEFAULT_REPORT_FILE):
+        """
+        print the stage totals, and write them to path as JSON
+        """
+        if not self.enabled:
+            return
+        summary = self.summary()
+        order = [s for s in STAGES if s in summary['stages']] + sorted(set(summary['stages']) - set(STAGES))
+        print('%-10s %6s %10s %10s %10s %12s %12s' % ('stage', 'calls', 'wall(s)', 'cpu(s)', 'sents', 'sents/s', 'tokens/s'))
+        for name in order:
+            s = summary['stages'][name]
+            print('%-10s %6d %10.2f %10.2f %10d %12.0f %12.0f' % (name, s['calls'], s['wall'], s['cpu'], s['sentences'],
+                s['sentences_per_sec'] or 0, s['tokens_per_sec'] or 0))
+        print('total wall time %.2fs' % summary['wall'])
+        if path:
+            with open(path, 'w') as fw:
+                json.dump(summary, fw, indent=2, sort_keys=True)
+            print('run report written to %s' % path)
+
+
+##
+# the stats shared by all call sites in a process
+_default_stats = []
+def default_stats():
+    if not _default_stats:
+        _default_stats.append(RunStats())
+    return _default_stats[0]
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# Which rows a scoring output covers: the convId, globalId and text hash of each row, the model that
+# scored it, and its scores, kept next to the output as <outputfile>.cover
+# A rerun copies the scores of the rows whose text and model are unchanged, and scores only the others
+# 10/18/2026
+
+from __future__ import print_function
+
+import os
+import csv
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from ngram_lm import _to_bytes
+
+
+COVER_COLUMNS = ['convId', 'globalId', 'textHash', 'model']
+
+
+##
+# the hash of a sentence's text, and the digest of a model file
+def text_hash(text):
+    return hashlib.sha1(_to_bytes(text)).hexdigest()[:16]
+
+# digests are kept by the path, size and mtime of the files, so an unchanged model is hashed once
+_digests = {}
+
+def file_digest(path, blocksize=2**20):
+    """
+    path: a file, or a folder of files such as a compiled .lmdir
+    """
+    paths = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+    key = (os.path.abspath(path),) + tuple((os.path.basename(p), os.path.getsize(p), os.path.getmtime(p)) for p in paths)
+    if key not in _digests:
+        _digests[key] = _hash_files(paths, blocksize)
+    return _digests[key]
+
+def _hash_files(paths, blocksize):
+    h = hashlib.sha1()
+    for p in paths:
+        h.update(_to_bytes(os.path.basename(p)))
+        with open(p, 'rb') as fr:
+            for block in iter(lambda: fr.read(blocksize), b''):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+def cover_path(outputfile):
+    return outputfile + '.cover'
+
+##
+# the rows of outputfile scored by model, as recorded in its cover file
+def read_cover(outputfile, model):
+    """
+    return: dict((convId, globalId, textHash) -> list of score str), empty if there is no cover file
+    """
+    covered = {}
+    path = cover_path(outputfile)
+    if not os.path.exists(path):
+        return covered
+    with open(path, 'r') as fr:
+        reader = csv.reader(fr)
+        next(reader)
+        for row in reader:
+            if row[3] == model:
+                covered[(int(row[0]), int(row[1]), row[2])] = row[4:]
+    return covered
+
+
+##
+# write a file under a temporary name, and move it to path once it is complete
+@contextmanager
+def atomic_write(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fw:
+            yield fw
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# Per-run, per-worker scratch directories, and SRILM training fed over a pipe
+# so that concurrent runs never share data/lm/train.txt or data/lm/train.lm
+# 10/18/2026
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+
+SRILM_DIR = os.environ.get('SRILM_DIR', '/Users/yangxu/projects/srilm-1.7.1/bin/macosx/')
+# where scratch directories are made; the system temp dir by default
+SCRATCH_ROOT = os.environ.get('SCRATCH_ROOT')
+
+
+##
+# a directory of the calling process's own, removed with all its files when the block exits
+@contextmanager
+def scratch_dir(prefix='run'):
+    path = tempfile.mkdtemp(prefix='%s_%s_' % (prefix, os.getpid()), dir=SCRATCH_ROOT)
+    try:
+        yield os.path.abspath(path)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+##
+# train an LM with `ngram-count`, streaming the training sentences to it over stdin
+def ngram_count(sentences, lmfile, order=3, srilm_dir=SRILM_DIR):
+    """
+    sentences: an iterable of str
+    lmfile: where the ARPA model is written, e.g., in a scratch_dir
+    """
+    train_cmd = [srilm_dir + 'ngram-count', '-order', str(order), '-text', '-', '-lm', lmfile]
+    with open(os.devnull, 'w') as FNULL: # suppress stdout and stderr
+        proc = subprocess.Popen(train_cmd, stdin=subprocess.PIPE, stdout=FNULL, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        try:
+            for text in sentences:
+                proc.stdin.write(text + '\n')
+        finally:
+            proc.stdin.close()
+            return_code = proc.wait()
+    if return_code != 0:
+        raise Exception('ngram-count failed with code %s' % return_code)
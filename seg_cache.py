@@ -0,0 +1,64 @@
+#!/usr/local/bin/python3
+# Segmentation results cached per conversation, keyed by a hash of its sentences and the config
+# Stored as one append-only file of JSON lines: {"key": ..., "bounds": [...]}
+# Yang Xu
+# 10/18/2026
+
+import hashlib
+import json
+import os
+
+
+DEFAULT_CACHE_FILE = os.environ.get('SEG_CACHE_FILE', 'data/seg_cache.jsonl')
+
+
+##
+# the cache key of a conversation segmented with config
+def seg_key(inputlist, config):
+    h = hashlib.sha1(config.encode('utf-8'))
+    for text in inputlist:
+        h.update(b'\n')
+        h.update(str(text).encode('utf-8'))
+    return h.hexdigest()
+
+
+class SegCache(object):
+    """
+    path: the file of cached results; it is read once, and new results are appended to it
+    """
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, 'r') as fr:
+                for line in fr:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue # a line cut short by an interrupted run
+                    self.results[item['key']] = item['bounds']
+
+    def get(self, key):
+        """
+        return: the cached boundaries, or None
+        """
+        res = self.results.get(key)
+        if res is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return res
+
+    def put(self, key, res):
+        # appended right away, so that an interrupted run keeps what it has segmented
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.results[key] = [int(b) for b in res]
+        with open(self.path, 'a') as fw:
+            fw.write(json.dumps({'key': key, 'bounds': self.results[key]}) + '\n')
+
+    def report(self):
+        print('segmentation cache {}: {} hits, {} misses'.format(self.path, self.hits, self.misses))
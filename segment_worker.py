@@ -0,0 +1,177 @@
+#!/usr/local/bin/python3
+# A long-lived segmenter process that takes many conversations over a pipe in one session,
+# for the segmenters that run in Python (LOCAL_CONFIGS), so that their startup is paid once per run
+# Protocol: one JSON list of sentences per line in, one JSON list of boundaries
+# (or {"error": message}) per line out, in the same order
+# bayes-seg configs are not served by the worker: bayes-seg (`./segment`) reads a single document
+# from stdin up to EOF, so conduct_segment still starts it, and a JVM, once per conversation
+# Yang Xu
+# 10/18/2026
+
+import subprocess
+import threading
+import queue
+from multiprocessing.pool import ThreadPool
+import json
+import sys
+import os
+
+
+# the configs served by an in-process segmenter, rather than by bayes-seg
+# 'native-dp' is dp_segment, the Bayesian DP segmenter of dp.config in Python
+LOCAL_CONFIGS = ['local', 'native-dp']
+
+
+##
+# the local stand-in for bayes-seg: a boundary every seglen sentences
+def local_segment(inputlist, seglen=10):
+    """
+    return: 1-indexed sentence positions of segment ends, as conduct_segment does
+    """
+    n = len(inputlist)
+    if n == 0:
+        return []
+    return list(range(seglen, n, seglen)) + [n]
+
+##
+# the segmentation function behind a config
+# for a bayes-seg config, a call to conduct_segment, i.e., one bayes-seg run per conversation
+def get_segmenter(config):
+    if config == 'local':
+        return local_segment
+    if config == 'native-dp':
+        from dp_segment import dp_segment
+        return dp_segment
+    from topic_segment import conduct_segment
+    return lambda inputlist: conduct_segment(inputlist, config=config)
+
+
+##
+# the worker side: segment the conversations read from fin, and write their boundaries to fout
+def serve(config, fin=sys.stdin, fout=sys.stdout):
+    segment = get_segmenter(config)
+    for line in fin:
+        try:
+            res = segment(json.loads(line))
+        except Exception as e:
+            res = {'error': '{}: {}'.format(type(e).__name__, e)}
+        try:
+            fout.write(json.dumps(res) + '\n')
+            fout.flush()
+        except BrokenPipeError:
+            # the client has closed the worker
+            break
+
+
+##
+# the client side: one worker process that lives until close() is called
+class SegmenterWorker(object):
+    """
+    config: one of LOCAL_CONFIGS
+    """
+    def __init__(self, config='native-dp'):
+        if config not in LOCAL_CONFIGS:
+            raise ValueError('{} runs bayes-seg once per conversation, and has no long-lived worker'.format(config))
+        self.config = config
+        cmd = [sys.executable, os.path.abspath(__file__), config]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True, bufsize=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError('segmenter worker exited with code {}'.format(self.proc.wait()))
+        res = json.loads(line)
+        if isinstance(res, dict):
+            raise RuntimeError('segmenter worker failed: {}'.format(res['error']))
+        return res
+
+    def segment(self, inputlist):
+        """
+        inputlist: a list of str
+        return: the sentence indice of topic boundaries, as conduct_segment
+        """
+        self.proc.stdin.write(json.dumps(list(inputlist)) + '\n')
+        self.proc.stdin.flush()
+        return self._read()
+
+    def segment_many(self, inputlists):
+        """
+        inputlists: an iterable of lists of str
+        return: a generator of boundaries, yielded as soon as each conversation is segmented
+        """
+        sent = queue.Queue() # one item per conversation written to the worker, then None
+        def feed():
+            try:
+                for inputlist in inputlists:
+                    self.proc.stdin.write(json.dumps(list(inputlist)) + '\n')
+                    self.proc.stdin.flush()
+                    sent.put(True)
+            except Exception as e:
+                sent.put(e)
+            sent.put(None)
+        writer = threading.Thread(target=feed)
+        writer.daemon = True
+        writer.start()
+        while True:
+            item = sent.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield self._read()
+        writer.join()
+
+    def close(self):
+        # closing stdout too stops a worker whose results were not all read
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+            self.proc.wait()
+
+
+##
+# segment inputlists in order
+def segment_all(inputlists, config='dp.config', workers=1):
+    """
+    workers: for LOCAL_CONFIGS, the number of worker processes, each taking every workers-th conversation;
+        for bayes-seg configs, the number of conduct_segment runs at a time
+    return: a generator of boundaries, in the order of inputlists
+    """
+    segment = get_segmenter(config)
+    if workers <= 1:
+        for inputlist in inputlists:
+            yield segment(list(inputlist))
+        return
+    if config not in LOCAL_CONFIGS:
+        # each call starts its own bayes-seg process, so threads are enough to run them in parallel
+        pool = ThreadPool(workers)
+        try:
+            for res in pool.imap(lambda inputlist: segment(list(inputlist)), inputlists):
+                yield res
+        finally:
+            pool.terminate()
+        return
+    inputlists = list(inputlists)
+    workers = max(min(workers, len(inputlists)), 1)
+    pool = [SegmenterWorker(config) for j in range(workers)]
+    try:
+        streams = [w.segment_many(inputlists[j::workers]) for j, w in enumerate(pool)]
+        for k in range(len(inputlists)):
+            yield next(streams[k % workers])
+    finally:
+        for w in pool:
+            w.close()
+
+
+##
+# main: run as a worker, e.g.,
+# $ python3 segment_worker.py native-dp
+if __name__ == '__main__':
+    serve(sys.argv[1])
@@ -0,0 +1,52 @@
+# The cross-validation drivers of comp_info_cont give the same entropies however the work is split:
+# over worker processes, or, for crossvalidate_samepos, with the n-gram counts shared between folds
+import csv
+import random
+
+import pytest
+
+# comp_info_cont imports the SRILM bindings
+try:
+    import srilm
+except ImportError as e:
+    pytest.skip('srilm does not import: %s' % e, allow_module_level=True)
+
+import lm_cache
+from comp_info_cont import crossvalidate, crossvalidate_samepos
+from benchmarks.synth_corpus import make_corpus
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    # models are trained afresh, rather than read from or written to the LM cache
+    monkeypatch.setattr(lm_cache, '_default_cache', [lm_cache.LMCache(str(tmp_path / 'lm_cache'), max_bytes=0)])
+    path = str(tmp_path / 'corpus.csv')
+    make_corpus(path, 'small', seed=0)
+    return path
+
+def read_rows(path):
+    with open(path, 'r') as fr:
+        return list(csv.reader(fr))
+
+
+def test_crossvalidate_workers(corpus, tmp_path):
+    outputs = []
+    for workers in (1, 2):
+        random.seed(2017)
+        outputfile = str(tmp_path / ('cv_workers%s.csv' % workers))
+        crossvalidate(corpus, outputfile, workers=workers)
+        outputs.append(read_rows(outputfile))
+    assert len(outputs[0]) > 1
+    assert outputs[1] == outputs[0]
+
+@pytest.mark.parametrize('share_counts, workers', [(True, 2), (False, 1), (False, 2)])
+def test_crossvalidate_samepos(corpus, tmp_path, share_counts, workers):
+    outputs = []
+    for share, w in ((True, 1), (share_counts, workers)):
+        random.seed(2017)
+        outputfile = str(tmp_path / ('sp_share%s_workers%s.csv' % (share, w)))
+        crossvalidate_samepos(corpus, outputfile, sent_n=5, share_counts=share, workers=w)
+        outputs.append(read_rows(outputfile))
+    assert len(outputs[0]) > 1
+    assert [row[:2] for row in outputs[1]] == [row[:2] for row in outputs[0]]
+    assert [float(row[2]) for row in outputs[1][1:]] == pytest.approx([float(row[2]) for row in outputs[0][1:]], abs=1e-9)
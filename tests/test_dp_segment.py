@@ -0,0 +1,43 @@
+# The in-process DP segmenter (dp_segment) against a brute-force search over all splits
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from dp_segment import dp_segment
+
+
+def segment_ll(inputlist, ends, prior):
+    tokens = [str(text).lower().split() for text in inputlist]
+    V = max(len(set(w for sent in tokens for w in sent)), 1)
+    total, start = 0.0, 0
+    for end in ends:
+        seg = [w for sent in tokens[start:end] for w in sent]
+        counts = [seg.count(w) for w in set(seg)]
+        total += math.lgamma(V * prior) - math.lgamma(len(seg) + V * prior)
+        total += sum(math.lgamma(c + prior) - math.lgamma(prior) for c in counts)
+        start = end
+    return total
+
+def conversation(n, seed):
+    rng = np.random.RandomState(seed)
+    words = ['w%d' % i for i in range(12)]
+    return [' '.join(rng.choice(words, size=rng.randint(0, 6))) for i in range(n)]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_exact_num_segs(seed):
+    inputlist = conversation(8, seed)
+    for k in (1, 2, 3):
+        ends = dp_segment(inputlist, num_segs=k)
+        assert len(ends) == k and ends[-1] == len(inputlist)
+        best = max(segment_ll(inputlist, list(cut) + [len(inputlist)], 0.1)
+            for cut in itertools.combinations(range(1, len(inputlist)), k - 1))
+        assert segment_ll(inputlist, ends, 0.1) == pytest.approx(best, abs=1e-9)
+
+def test_max_len():
+    inputlist = conversation(40, 0)
+    ends = dp_segment(inputlist, max_len=6)
+    assert (np.diff(np.r_[0, ends]) <= 6).all()
+    assert dp_segment([]) == []
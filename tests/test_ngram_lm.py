@@ -0,0 +1,144 @@
+# Checks of the in-process LM (ngram_lm) against SRILM's estimates, and of the model formats
+from __future__ import division
+
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from ngram_lm import good_turing_coeffs, discount_factors, train_lm, read_arpa, score_tokens, corpus_stats, \
+    trie_grams, save_lm, compile_arpa, load_model, START_ID
+
+
+def _which(cmd):
+    for d in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(d, cmd)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+# a small corpus with enough repetition for every order to be discounted
+def small_corpus(nsents=400, seed=0, vocab_size=40):
+    rng = np.random.RandomState(seed)
+    words = ['w%d' % i for i in range(vocab_size)]
+    p = 1.0 / np.arange(1, len(words) + 1)
+    p /= p.sum()
+    return [' '.join(rng.choice(words, size=rng.randint(1, 12), p=p)) for i in range(nsents)]
+
+# the n-grams of each order in a model, as rows of word ids
+def model_grams(lm):
+    V = len(lm.vocab)
+    return trie_grams([None, np.arange(V)] + lm.keys[2:], V)
+
+# write a model as an ARPA file, with the probabilities written out in full
+def write_arpa(lm, path):
+    grams = model_grams(lm)
+    words = list(lm.vocab.words)
+    with open(path, 'w') as fw:
+        fw.write('\\data\\\n')
+        fw.write('ngram 1=%d\n' % np.isfinite(lm.logprobs[1]).sum())
+        for n in range(2, lm.order+1):
+            fw.write('ngram %d=%d\n' % (n, len(lm.keys[n])))
+        fw.write('\n\\1-grams:\n')
+        for i, w in enumerate(words):
+            if np.isfinite(lm.logprobs[1][i]):
+                fw.write('%r %s %r\n' % (float(lm.logprobs[1][i]), w, float(lm.bows[1][i])))
+        for n in range(2, lm.order+1):
+            fw.write('\n\\%d-grams:\n' % n)
+            for g, lp, bow in zip(grams[n], lm.logprobs[n], lm.bows[n]):
+                fw.write('%r %s %r\n' % (float(lp), ' '.join(words[x] for x in g), float(bow)))
+        fw.write('\n\\end\\\n')
+
+
+##
+# the bigram count-of-counts of a same-position training set, n[1..8] = 321, 11, 13, 2, 2, 2, 1, 0,
+# with the coefficients SRILM's ngram-count estimates from them (-gt2max 7 lowered to 6)
+SAMEPOS_COUNT_OF_COUNTS = [321, 11, 13, 2, 2, 2, 1, 0]
+
+def test_good_turing_lowers_maxcount():
+    counts = np.repeat(np.arange(1, 9), SAMEPOS_COUNT_OF_COUNTS)
+    coeffs, maxcount = good_turing_coeffs(counts, 7)
+    assert maxcount == 6
+    assert coeffs[1] == pytest.approx(0.0478, abs=1e-4)
+    assert coeffs[3] == pytest.approx(0.1874, abs=1e-4)
+    # counts above the lowered maxcount are not discounted
+    disc = discount_factors(counts, 'gt', 1, 7)
+    for r in (1, 3, 6):
+        assert (disc[counts == r] == coeffs[r]).all()
+    assert (disc[counts == 7] == 1.0).all()
+
+def test_good_turing_without_singletons():
+    coeffs, maxcount = good_turing_coeffs(np.array([2, 2, 3, 5]), 7)
+    assert maxcount == 0
+    assert (discount_factors(np.array([2, 2, 3, 5]), 'gt', 1, 7) == 1.0).all()
+
+##
+# words not in the vocab are OOVs, as in `ngram -ppl`, even when the model has <unk>, unless unk is asked for
+def test_oovs_are_not_unk_by_default():
+    lm = train_lm(['a b <unk> c', 'a <unk> b', 'b c a'])
+    test = ['a zz b', 'qq']
+    stats = corpus_stats(lm, test)
+    assert stats.numOOVs == 2
+    unk_stats = corpus_stats(lm, test, unk=True)
+    assert unk_stats.numOOVs == 0
+    assert unk_stats.numWords == stats.numWords
+
+
+##
+# p(w | context) sums to one over the vocab for every order, whether the context is in the model or backed off,
+# including the contexts added back when their own count is below -gtNmin, which are non-monotone here for order 3;
+# the vocab is large enough for every Kneser-Ney count-of-count to be non-zero
+@pytest.mark.parametrize('discount, order, mincounts', [
+    ('gt', 3, None), ('kn', 3, None), ('gt', 4, None), ('kn', 4, None), ('gt', 4, {2: 3, 3: 1, 4: 2})])
+def test_probabilities_sum_to_one(discount, order, mincounts):
+    lm = train_lm(small_corpus(2000, vocab_size=400), order=order, discount=discount, mincounts=mincounts)
+    V = len(lm.vocab)
+    words = np.arange(V)
+    words = words[words != START_ID]
+    assert (10.0 ** lm.logprobs[1][words]).sum() == pytest.approx(1.0, abs=1e-4)
+    grams = model_grams(lm)
+    rng = np.random.RandomState(0)
+    for n in range(2, order+1):
+        # contexts of the model's n-grams, and random ones, most of which are backed off
+        contexts = np.vstack([grams[n][rng.choice(len(grams[n]), 20), :-1], rng.choice(words, size=(10, n-1))])
+        for ctx in contexts:
+            lp = lm.logprob_ids(np.tile(ctx, (len(words), 1)), words)
+            assert (10.0 ** lp).sum() == pytest.approx(1.0, abs=1e-4)
+
+
+##
+# a model scores the same after an ARPA, .npz or .lmdir round trip
+def test_model_round_trips(tmp_path):
+    lm = train_lm(small_corpus(), order=3)
+    test = small_corpus(100, seed=1) + ['w1 unseen w2']
+    ref = score_tokens(lm, test)[1]
+    arpa = str(tmp_path / 'train.lm')
+    write_arpa(lm, arpa)
+    npz = str(tmp_path / 'train.npz')
+    save_lm(lm, npz)
+    for path in (arpa, compile_arpa(arpa), npz):
+        loaded = load_model(path)
+        assert loaded.order == lm.order
+        assert sorted(loaded.vocab.words) == sorted(lm.vocab.words)
+        np.testing.assert_array_equal(score_tokens(loaded, test)[1], ref)
+    # a model written back from an ARPA file reads the same
+    again = str(tmp_path / 'again.lm')
+    write_arpa(read_arpa(arpa), again)
+    with open(arpa) as fa, open(again) as fb:
+        assert fa.read() == fb.read()
+
+
+##
+# the same corpus trained by ngram-count, when SRILM is installed
+@pytest.mark.skipif(_which('ngram-count') is None, reason='SRILM ngram-count is not installed')
+def test_matches_ngram_count(tmp_path):
+    sents = small_corpus()
+    textfile, lmfile = str(tmp_path / 'train.txt'), str(tmp_path / 'train.lm')
+    with open(textfile, 'w') as fw:
+        fw.write('\n'.join(sents) + '\n')
+    subprocess.check_call(['ngram-count', '-order', '3', '-text', textfile, '-lm', lmfile])
+    test = small_corpus(100, seed=1)
+    ref = score_tokens(read_arpa(lmfile), test)[1]
+    lp = score_tokens(train_lm(sents, order=3), test)[1]
+    np.testing.assert_allclose(lp, ref, atol=1e-4)
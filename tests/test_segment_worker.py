@@ -0,0 +1,58 @@
+# The long-lived segmenter worker (segment_worker), with the in-process segmenters
+import sys
+
+import pytest
+
+if sys.version_info[0] < 3:
+    pytest.skip('segment_worker runs under Python 3', allow_module_level=True)
+
+import segment_worker
+from segment_worker import SegmenterWorker, segment_all, local_segment
+from dp_segment import dp_segment
+
+
+def conversations(nconvs=12):
+    words = ['alpha beta gamma', 'beta gamma delta', 'delta epsilon', 'zeta eta theta', 'eta theta iota kappa']
+    return [[words[(i + j // 7) % len(words)] for j in range(5 + 3 * i)] for i in range(nconvs)]
+
+
+def test_worker_streams_in_order():
+    convs = conversations()
+    with SegmenterWorker('local') as worker:
+        assert list(worker.segment_many(convs)) == [local_segment(c) for c in convs]
+        # the same process takes more conversations afterwards
+        assert worker.segment(convs[3]) == local_segment(convs[3])
+
+@pytest.mark.parametrize('config', ['local', 'native-dp'])
+def test_worker_pool_matches_serial(config):
+    convs = conversations()
+    serial = list(segment_all(convs, config=config, workers=1))
+    assert list(segment_all(convs, config=config, workers=3)) == serial
+    if config == 'native-dp':
+        assert serial == [dp_segment(c) for c in convs]
+
+def test_worker_errors_are_raised():
+    with SegmenterWorker('local') as worker:
+        # a line that is not a list of sentences fails in the worker, which goes on with the next one
+        worker.proc.stdin.write('5\n')
+        worker.proc.stdin.flush()
+        with pytest.raises(RuntimeError):
+            worker._read()
+        assert worker.segment(['a'] * 12) == [10, 12]
+
+def test_no_worker_for_bayes_seg():
+    with pytest.raises(ValueError):
+        SegmenterWorker('dp.config')
+
+def test_bayes_seg_runs_in_order(monkeypatch):
+    # bayes-seg is stood in for by local_segment, one call per conversation as conduct_segment
+    calls = []
+    def fake_segmenter(config):
+        def segment(inputlist):
+            calls.append(len(inputlist))
+            return local_segment(inputlist)
+        return segment
+    monkeypatch.setattr(segment_worker, 'get_segmenter', fake_segmenter)
+    convs = conversations()
+    assert list(segment_all(convs, config='dp.config', workers=3)) == [local_segment(c) for c in convs]
+    assert len(calls) == len(convs)
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# Per-token scores kept next to the per-sentence entropy outputs, as a folder of chunked columnar .npz files:
+# each chunk holds the convId and globalId of its sentences, the offsets of their tokens,
+# and the word id, log10 prob, backoff order and OOV flag of each token (the words of a sentence and </s>)
+# so that analyses by token stream from disk instead of rescoring
+# 10/18/2026
+
+from __future__ import print_function
+
+import os
+import tempfile
+import numpy as np
+
+from ngram_lm import write_vocab, load_vocab
+from job_queue import _makedirs
+
+
+TOKEN_COLUMNS = ['ids', 'logprobs', 'orders', 'oov']
+SENTENCE_COLUMNS = ['convId', 'globalId']
+
+
+def chunk_path(tokendir, name):
+    return os.path.join(tokendir, name + '.npz')
+
+
+##
+# write the tokens of a chunk of sentences, as returned by ngram_lm.score_tokens
+def write_chunk(tokendir, name, cids, gids, ids, logprobs, orders, offsets):
+    """
+    name: the name of the chunk, e.g., the fold or the work unit it was scored in
+    cids, gids: the convId and globalId of each sentence
+    """
+    _makedirs(tokendir)
+    fd, tmp_path = tempfile.mkstemp(dir=tokendir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fw:
+            np.savez_compressed(fw, convId=np.asarray(cids, dtype=np.int64), globalId=np.asarray(gids, dtype=np.int64),
+                offsets=np.asarray(offsets, dtype=np.int64), ids=np.asarray(ids, dtype=np.int32),
+                logprobs=np.asarray(logprobs, dtype=np.float32), orders=np.asarray(orders, dtype=np.int8),
+                oov=np.isneginf(logprobs))
+        os.rename(tmp_path, chunk_path(tokendir, name))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+##
+# list the chunks of tokendir in the order of the sentences of the entropy output, and the vocab of their ids
+def write_index(tokendir, names, vocab):
+    _makedirs(tokendir)
+    write_vocab(vocab, tokendir)
+    with open(os.path.join(tokendir, 'index.txt'), 'w') as fw:
+        for name in names:
+            fw.write(name + '\n')
+
+
+##
+# read back a folder written by write_chunk and write_index
+def read_vocab(tokendir):
+    return load_vocab(tokendir)
+
+def read_chunks(tokendir):
+    """
+    return: an iterator of dicts, one per chunk in index order, with the arrays of
+        SENTENCE_COLUMNS and TOKEN_COLUMNS, and the token offsets of each sentence
+    """
+    with open(os.path.join(tokendir, 'index.txt'), 'r') as fr:
+        names = [line.strip() for line in fr if line.strip() != '']
+    for name in names:
+        with np.load(chunk_path(tokendir, name)) as data:
+            yield dict((k, data[k]) for k in data.files)
@@ -9,34 +9,39 @@ import ast
 import os
 import pandas as pd
 import numpy as np
-import random
 import math
 
+from segment_worker import segment_all, LOCAL_CONFIGS
+from seg_cache import SegCache, seg_key
+from run_stats import default_stats
+
 
 ##
 # take a list of str as input, and output the sentence index of segment boundaries
-def conduct_segment(inputlist, config = 'dp.config'):
+def conduct_segment(inputlist, config = 'dp.config', tmp_file = None):
     # NOTE: we found that the result returned by bayes-seg is 1-indexed
     # sentence positions
     """
     inputlist: a list of str
     config: one of ['dp.config', 'cue.config', 'mcsopt.ai.config', 'ui.config']
+    tmp_file: a file to pass the text through; by default it is piped to the segmenter instead
     """
     assert config in ['dp.config', 'cue.config', 'mcsopt.ai.config', 'ui.config']
+    text = ''.join(row + '\n' for row in inputlist)
 
-    # save inputlist to a temporary file
-    tmp_file = 'data/tmp/text_to_seg.txt'
-    with open(tmp_file, 'w') as f:
-        for row in inputlist:
-            f.write(row + '\n')
-    tmp_file_full = os.path.join(os.getcwd(), tmp_file)
-
-    # run segment script
-    cmd = ['./conduct_segment.sh', tmp_file_full, config]
-    proc = subprocess.Popen(cmd, stdout = subprocess.PIPE)
-
+    # run segment script, which reads the text from stdin when given '-'
+    if tmp_file is None:
+        text_file = '-'
+    else:
+        with open(tmp_file, 'w') as f:
+            f.write(text)
+        text_file = os.path.abspath(tmp_file)
+    cmd = ['./conduct_segment.sh', text_file, config]
+    proc = subprocess.Popen(cmd, stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+    output = proc.communicate(text.encode('utf-8') if tmp_file is None else None)[0].splitlines()
+
+    last = None
     try:
-        output = proc.stdout.readlines()
         last = output[-1].strip().decode('utf-8')
         res = ast.literal_eval(last)
     except Exception as e:
@@ -49,32 +54,80 @@ def conduct_segment(inputlist, config = 'dp.config'):
         return res
 
 
+##
+# topicId and inTopicId of consecutive segments, from the length of every segment
+# and the number of segments in each conversation
+def segment_ids(seglens, nsegs):
+    """
+    seglens: the lengths of all segments, conversation by conversation
+    nsegs: the number of segments in each conversation
+    return: (topicId, inTopicId), two int32 arrays of sum(seglens) rows
+    """
+    seglens = np.asarray(seglens, dtype=np.int64)
+    nsegs = np.asarray(nsegs, dtype=np.int64)
+    topic_ids = np.empty(seglens.sum(), dtype=np.int32)
+    in_topic_ids = np.empty(seglens.sum(), dtype=np.int32)
+    # the number of each segment within its conversation, repeated over its rows
+    seg_no = np.arange(len(seglens)) - np.repeat(np.cumsum(nsegs) - nsegs, nsegs) + 1
+    topic_ids[:] = np.repeat(seg_no, seglens)
+    # the position of each row within its segment
+    in_topic_ids[:] = np.arange(len(topic_ids)) - np.repeat(np.cumsum(seglens) - seglens, seglens) + 1
+    return topic_ids, in_topic_ids
+
+##
+# the row positions of each convId in df, found in one pass
+def conv_rows(df):
+    """
+    return: (cids, rows_of), the convIds in order of appearance and dict(convId -> row positions)
+    """
+    rows_of = df.groupby('convId', sort=False).indices
+    return list(rows_of.keys()), rows_of
+
+##
+# attach the ids made by segment_ids to the rows of the given conversations, and drop the other rows
+def assign_ids(df, conv_rows_list, seglens, nsegs):
+    """
+    conv_rows_list: the row positions of each conversation in df, as ordered in seglens and nsegs
+    """
+    topic_ids = np.zeros(len(df), dtype=np.int32)
+    in_topic_ids = np.zeros(len(df), dtype=np.int32)
+    if len(conv_rows_list) == 0:
+        return df.iloc[:0].assign(topicId=topic_ids[:0], inTopicId=in_topic_ids[:0])
+    rows = np.concatenate(conv_rows_list)
+    topic_ids[rows], in_topic_ids[rows] = segment_ids(seglens, nsegs)
+    kept = np.zeros(len(df), dtype=bool)
+    kept[rows] = True
+    return df[kept].assign(topicId=topic_ids[kept], inTopicId=in_topic_ids[kept])
+
+
 ##
 # make topicId and inTopicId from the result of conduct_segment
 def make_topic_ids(bound_ind):
     """
     bound_ind: the sentence indice of topic boundaries, returned by conduct_segment
-    return: a dict of two lists, {'topicId': [1,1,1,...], 'inTopicId': [1,2,3,...]}
+    return: a dict of two int32 arrays, {'topicId': [1,1,1,...], 'inTopicId': [1,2,3,...]}
     """
-    ids1 = [] # topicId
-    ids2 = [] # inTopicId
-    for i, ind in enumerate(bound_ind):
-        length = ind if i == 0 else ind - bound_ind[i-1]
-        ids1 += [i+1] * length
-        ids2 += list(range(1, length+1))
-    return {'topicId': ids1, 'inTopicId': ids2}
+    seglens = np.diff(np.r_[0, bound_ind])
+    topic_ids, in_topic_ids = segment_ids(seglens, [len(seglens)])
+    return {'topicId': topic_ids, 'inTopicId': in_topic_ids}
 
 
 ##
 # segment text data file: 'data/SWBD_text_db.csv', 'data/BNC_text_db100.csv', & 'data/BNC_text_dbfull.csv'
-def seg_textdata(inputfile, outputfile, config = 'dp.config'):
+def seg_textdata(inputfile, outputfile, config = 'dp.config', workers = 1, cache = True):
     """
-    config: one of ['dp.config', 'cue.config', 'mcsopt.ai.confi', 'ui.config']
+    config: one of ['dp.config', 'cue.config', 'mcsopt.ai.confi', 'ui.config'], or LOCAL_CONFIGS
+    workers: the number of segmenter processes that run in parallel
+    cache: reuse the boundaries of conversations segmented before with the same text and config
+        True for the default SegCache, or a SegCache, or False
     """
-    assert config in ['dp.config', 'cue.config', 'mcsopt.ai.config', 'ui.config']
+    assert config in ['dp.config', 'cue.config', 'mcsopt.ai.config', 'ui.config'] + LOCAL_CONFIGS
+    stats = default_stats()
 
     # read textdata into a pandas dataframe
-    df = pd.read_csv(inputfile)
+    with stats.stage('read') as timer:
+        df = pd.read_csv(inputfile)
+        timer.count(len(df))
     # BTW, examine if `wodNum` column exists in df
     # if not, create it from `rawWord` column
     if 'rawWord' not in df.columns:
@@ -90,39 +143,56 @@ def seg_textdata(inputfile, outputfile, config = 'dp.config'):
         df = df[df.convId.isin(included_cids)]
         # remove NaNs in rawWord
         df = df[df.rawWord.notnull()]
-
-
-    # call conduct_segment for each convId
-    df_ids = pd.DataFrame()
-    for i, cid in enumerate(df.convId.unique()):
-        sentlist = list(df[df.convId == cid].rawWord)
+    df = df.reset_index(drop=True)
+
+    # the row positions of each convId, found in one pass
+    cids, rows_of = conv_rows(df)
+    texts = df.rawWord.values
+
+    # look up the convIds in the cache, and segment the others in a pool of segmenter processes
+    cache = SegCache() if cache is True else cache
+    keys = [seg_key(texts[rows_of[cid]], config) for cid in cids]
+    cached = [cache.get(key) for key in keys] if cache else [None] * len(cids)
+    todo = [cid for cid, res in zip(cids, cached) if res is None]
+    seglens, nsegs = [], []
+    results = segment_all((list(texts[rows_of[cid]]) for cid in todo), config=config, workers=workers)
+    for i, cid in enumerate(cids):
         try:
-            res = conduct_segment(inputlist=sentlist, config=config)
+            if cached[i] is not None:
+                res = cached[i]
+            else:
+                with stats.stage('segment', sentences=len(rows_of[cid])):
+                    res = next(results)
         except Exception as e:
             print('problematic convId: {}'.format(cid))
-            print('length of sentlist: {}'.format(len(sentlist)))
+            print('length of sentlist: {}'.format(len(rows_of[cid])))
+            results.close()
             raise
-        ids = make_topic_ids(res)
-        df_tmp = pd.DataFrame(ids)
-        # DEBUG code
-        if df_tmp.shape[0] != df[df.convId == cid].shape[0]:
-            print('df_tmp.shape[0] == {}'.format(df_tmp.shape[0]))
+        lens = np.diff(np.r_[0, res])
+        if lens.sum() != len(rows_of[cid]):
+            print('sum of segment lengths == {}'.format(lens.sum()))
             print('res:\n{}'.format(res))
-            print('ids:\n{}'.format(ids))
             raise Exception('inconsistent length')
-        # end DEBUG
-        # combine
-        df_ids = pd.concat([df_ids, df_tmp], axis=0)
+        if cache and cached[i] is None:
+            cache.put(keys[i], res)
+        seglens.append(lens)
+        nsegs.append(len(lens))
         # print progress
-        sys.stdout.write('\r{0}/{1} convIds segmented'.format(i+1, len(df.convId.unique())))
+        sys.stdout.write('\r{0}/{1} convIds segmented'.format(i+1, len(cids)))
         sys.stdout.flush()
+    results.close()
+    if cache:
+        print()
+        cache.report()
 
-    # save df_ids temporarily
-    tmpfile = inputfile[:-4] + '_ids.csv'
-    df_ids.to_csv(tmpfile, sep=',', index=False)
-    # combine df and df_ids
-    df1 = pd.concat([df.reset_index(drop=True), df_ids.reset_index(drop=True)], axis=1) # reset_index is necessary
-    df1.to_csv(outputfile, sep=',', index=False)
+    # make the ids of all convIds at once, and put them back at their rows
+    df1 = assign_ids(df, [rows_of[cid] for cid in cids], np.concatenate(seglens) if seglens else [], nsegs)
+
+    # save the ids temporarily
+    with stats.stage('write', sentences=len(df1)):
+        tmpfile = inputfile[:-4] + '_ids.csv'
+        df1[['topicId', 'inTopicId']].to_csv(tmpfile, sep=',', index=False)
+        df1.to_csv(outputfile, sep=',', index=False)
 
 
 ##
@@ -168,33 +238,23 @@ def pseudo_seg_fixedlen(inputfile, outputfile, seglen=10):
         df = df[df.rawWord.notnull()]
 
     # For all convIds, assign pseudo segment Ids
-    df_ids = pd.DataFrame()
-    discarded_convIds = []
-    for i, cid in enumerate(df.convId.unique()):
-        nrow = df[df.convId == cid].shape[0]
-        # discared conversations that are too short
-        if nrow < seglen:
-            discarded_convIds.append(cid)
-            continue
-        # create pseudo ids
-        pseudo_ids = make_pseudo_ids(nrow, seglen)
-        df_tmp = pd.DataFrame(pseudo_ids)
-        # combine
-        df_ids = pd.concat([df_ids, df_tmp], axis=0)
-        # print progress
-        sys.stdout.write('\r{0}/{1} convIds segmented'.format(i+1, len(df.convId.unique())))
-        sys.stdout.flush()
-
-    # combine df and df_ids
-    if len(discarded_convIds) > 0:
-        df = df[~df.convId.isin(discarded_convIds)]
-    df1 = pd.concat([df.reset_index(drop=True), df_ids.reset_index(drop=True)], axis=1) # reset_index is necessary
+    df = df.reset_index(drop=True)
+    cids, rows_of = conv_rows(df)
+    # discared conversations that are too short
+    kept_rows = [rows_of[cid] for cid in cids if len(rows_of[cid]) >= seglen]
+    nrows = np.array([len(rows) for rows in kept_rows], dtype=np.int64)
+    seglens, nsegs = pseudo_seglens(nrows, seglen, seglen)
+    df1 = assign_ids(df, kept_rows, seglens, nsegs)
     df1.to_csv(outputfile, sep=',', index=False)
 
-
 ##
 # Pseudo segmentation using random length (determined by minlen and maxlen)
-def pseudo_seg_randlen(inputfile, outputfile, minlen, maxlen):
+def pseudo_seg_randlen(inputfile, outputfile, minlen, maxlen, seed=None, replicates=1):
+    """
+    seed: the seed of the numpy random Generator, for reproducible segments
+    replicates: the number of independent pseudo segmentations; when more than one,
+        the rows are repeated once per replicate, with a `replicate` column (1, 2, ...)
+    """
     # read textdata into a pandas dataframe
     df = pd.read_csv(inputfile)
     # BTW, examine if `wodNum` column exists in df
@@ -212,85 +272,67 @@ def pseudo_seg_randlen(inputfile, outputfile, minlen, maxlen):
         # remove NaNs in rawWord
         df = df[df.rawWord.notnull()]
 
-    # For all convIds, assign pseudo segment Ids
-    df_ids = pd.DataFrame()
-    discarded_convIds = []
-    for i, cid in enumerate(df.convId.unique()):
-        nrow = df[df.convId == cid].shape[0]
-        # discared conversations that are too short
-        if nrow < minlen:
-            discarded_convIds.append(cid)
-            continue
-        # create pseudo ids
-        try:
-            pseudo_ids = make_pseudo_ids_rand(nrow, minlen, maxlen)
-        except Exception as e:
-            print('\nproblematic cid: {}'.format(cid))
-            print('nrow = {}'.format(nrow))
-            print('minlen = {0}, maxlen = {1}'.format(minlen, maxlen))
-            raise
-        else:
-            # combine
-            df_tmp = pd.DataFrame(pseudo_ids)
-            df_ids = pd.concat([df_ids, df_tmp], axis=0)
-        # print progress
-        sys.stdout.write('\r{0}/{1} convIds segmented'.format(i+1, len(df.convId.unique())))
-        sys.stdout.flush()
-
-    # combine df and df_ids
-    if len(discarded_convIds) > 0:
-        df = df[~df.convId.isin(discarded_convIds)]
-    df1 = pd.concat([df.reset_index(drop=True), df_ids.reset_index(drop=True)], axis=1) # reset_index is necessary
+    # For all convIds and all replicates, draw pseudo segments at once
+    df = df.reset_index(drop=True)
+    cids, rows_of = conv_rows(df)
+    # discared conversations that are too short
+    kept_rows = [rows_of[cid] for cid in cids if len(rows_of[cid]) >= minlen]
+    nrows = np.array([len(rows) for rows in kept_rows], dtype=np.int64)
+    seglens, nsegs = pseudo_seglens(np.tile(nrows, replicates), minlen, maxlen, np.random.default_rng(seed))
+    nsegs = nsegs.reshape(replicates, len(nrows))
+    seg_end = np.cumsum(nsegs.sum(axis=1))
+    dfs = []
+    for r in range(replicates):
+        df_r = assign_ids(df, kept_rows, seglens[seg_end[r] - nsegs[r].sum():seg_end[r]], nsegs[r])
+        if replicates > 1:
+            df_r['replicate'] = r + 1
+        dfs.append(df_r)
+    df1 = pd.concat(dfs, axis=0) if replicates > 1 else dfs[0]
     df1.to_csv(outputfile, sep=',', index=False)
-    pass
-
 
 ##
 # the func that creates pseudo seg_ids and in_seg_ids columns, using fixed seglen
 def make_pseudo_ids(n, seglen):
     assert n >= seglen
-    seg_ids = []
-    in_seg_ids = []
-    nseg = n // seglen
-    nres = n % seglen
-    for j in range(nseg):
-        seg_ids += [j+1] * seglen
-        in_seg_ids += list(range(1, seglen+1))
-    if nres > 0:
-        seg_ids += [nseg+1] * nres
-        in_seg_ids += list(range(1, nres+1))
+    seglens = [seglen] * (n // seglen) + ([n % seglen] if n % seglen > 0 else [])
+    seg_ids, in_seg_ids = segment_ids(seglens, [len(seglens)])
     return {'topicId': seg_ids, 'inTopicId': in_seg_ids}
 
+##
+# draw random segment lengths between minlen and maxlen for many conversations at once,
+# the last segment of each conversation being cut to fit
+def pseudo_seglens(nrows, minlen, maxlen, rng=None):
+    """
+    nrows: the number of rows of each conversation
+    rng: a numpy.random.Generator, not needed (nor drawn from) if minlen == maxlen
+    return: (seglens, nsegs), as taken by segment_ids
+    """
+    nrows = np.asarray(nrows, dtype=np.int64)
+    # enough draws to cover each conversation with segments of minlen
+    ndraws = -(-nrows // minlen)
+    conv = np.repeat(np.arange(len(nrows)), ndraws)
+    if minlen == maxlen:
+        lens = np.full(len(conv), minlen, dtype=np.int64)
+    else:
+        lens = rng.integers(minlen, maxlen, size=len(conv), endpoint=True)
+    # the end of each segment within its conversation
+    ends = np.cumsum(lens)
+    ends -= np.repeat(np.r_[0, ends][np.cumsum(ndraws) - ndraws], ndraws)
+    starts = ends - lens
+    kept = starts < nrows[conv]
+    seglens = np.minimum(ends, nrows[conv])[kept] - starts[kept]
+    nsegs = np.bincount(conv[kept], minlength=len(nrows))
+    return seglens, nsegs
+
 ##
 # create pseudo ids, using random seglen
-def make_pseudo_ids_rand(n, minlen, maxlen):
+def make_pseudo_ids_rand(n, minlen, maxlen, rng=None):
     assert n >= minlen
-    seg_ids = []
-    in_seg_ids = []
-    count = 0
-    while count < n:
-        randlen = random.randint(minlen, maxlen)
-        if count + randlen <= n:
-            try:
-                ids1 = [1] * randlen if count == 0 else [seg_ids[-1]+1] * randlen
-                ids2 = list(range(1, randlen+1))
-                seg_ids += ids1
-                in_seg_ids += ids2
-                count += randlen
-            except IndexError as e:
-                print('\nrandlen = {0}, count = {1}'.format(randlen, count))
-                raise
-        else:
-            nres = n - count
-            ids1 = [1] * nres if count == 0 else [seg_ids[-1]+1] * nres
-            ids2 = list(range(1, nres+1))
-            seg_ids += ids1
-            in_seg_ids += ids2
-            count += nres
+    rng = rng if rng is not None else np.random.default_rng()
+    seg_ids, in_seg_ids = segment_ids(*pseudo_seglens([n], minlen, maxlen, rng))
     return {'topicId': seg_ids, 'inTopicId': in_seg_ids}
 
 
-
 ##
 # main
 if __name__ == '__main__':
@@ -311,6 +353,10 @@ if __name__ == '__main__':
     # seg_textdata(inputfile='data/BNC_text_dbfull_mlrcut.csv', outputfile='data/BNC_text_dbfull_mlrcut_mcsopt.csv', config='mcsopt.ai.config')
     # elapse 7:25.81 total
 
+    # segment SWBD and BNC with the in-process DP segmenter
+    # seg_textdata(inputfile='data/SWBD_text_db.csv', outputfile='data/SWBD_text_db_nativedp.csv', config='native-dp')
+    # seg_textdata(inputfile='data/BNC_text_dbfull_mlrcut.csv', outputfile='data/BNC_text_dbfull_mlrcut_nativedp.csv', config='native-dp', workers=4)
+
     # segment SWBD using cue.config, DO NOT work
     # seg_textdata(inputfile='data/SWBD_text_db.csv', outputfile='data/SWBD_text_db_cue.csv', config='cue.config')
     # segment SWBD using ui.config, DO NOT work
@@ -322,6 +368,12 @@ if __name__ == '__main__':
     # pseudo_seg_fixedlen(inputfile='data/BNC_text_dbfull_mlrcut.csv', outputfile='data/BNC_text_dbfull_mlrcut_pseudofixed.csv', seglen=10)
 
     # assign pseudo ids (random length) to SWBD
-    pseudo_seg_randlen(inputfile='data/SWBD_text_db.csv', outputfile='data/SWBD_text_db_pseudorand.csv', minlen=5, maxlen=11)
+    pseudo_seg_randlen(inputfile='data/SWBD_text_db.csv', outputfile='data/SWBD_text_db_pseudorand.csv', minlen=5, maxlen=11, seed=2017)
     # assign pseudo ids (random length) to BNC
-    pseudo_seg_randlen(inputfile='data/BNC_text_dbfull_mlrcut.csv', outputfile='data/BNC_text_dbfull_mlrcut_pseudorand.csv', minlen=5, maxlen=15)
+    pseudo_seg_randlen(inputfile='data/BNC_text_dbfull_mlrcut.csv', outputfile='data/BNC_text_dbfull_mlrcut_pseudorand.csv', minlen=5, maxlen=15, seed=2017)
+
+    # many replicates of random-length pseudo ids, for the real vs. pseudo boundary figures
+    # pseudo_seg_randlen(inputfile='data/SWBD_text_db.csv', outputfile='data/SWBD_text_db_pseudorand_reps.csv', minlen=5, maxlen=11, seed=2017, replicates=100)
+
+    # where the time went, if run with RUN_STATS=1
+    default_stats().report()